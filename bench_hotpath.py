@@ -0,0 +1,62 @@
+# Checks the native/viper builds in hotpath.py against a plain bytecode
+# build of the same source, then times both. Needs hotpath.py on the Pico.
+# Run with: mpremote run bench_hotpath.py
+import time
+import hotpath
+
+ROUNDS = 200
+
+# Same source with the emitter decorators stripped -> ordinary bytecode.
+src = open("hotpath.py").read()
+for deco in ("@micropython.native\n", "@micropython.viper\n"):
+    src = src.replace(deco, "")
+plain = {"__name__": "hotpath_plain", "ptr8": lambda buf: buf}
+exec(src, plain)
+
+MASK = bytes((0x37, 0xFA, 0x21, 0x3D))
+MARKERS = (b"STATE ", b"SELECTOR_LABELS ")
+DNS_QUERY = b"\x00" * 12 + b"\x07connect\x04rom\x09microsoft\x03com\x00\x00\x01\x00\x01"
+
+
+def run_unmask(mod, n):
+    buf = bytearray(i & 0xFF for i in range(n))
+    mod["unmask"](buf, n, memoryview(MASK))
+    return bytes(buf)
+
+
+def run_match(mod, line):
+    return [mod["match_marker"](line, i, len(line), MARKERS) for i in range(len(line))]
+
+
+CASES = (
+    ("unmask 32", lambda m: run_unmask(m, 32)),
+    ("unmask 512", lambda m: run_unmask(m, 512)),
+    ("ws_header 90", lambda m: m["ws_header"](0x81, 90)),
+    ("ws_header 300", lambda m: m["ws_header"](0x81, 300)),
+    ("ws_header 70000", lambda m: m["ws_header"](0x81, 70000)),
+    ("match_marker", lambda m: run_match(m, b"xSTATE VOL=12 SELECTOR_LAB")),
+    ("url_decode", lambda m: m["url_decode"]("ssid=My+Net%21&password=p%40ss%zz")),
+    ("decode_dns_name", lambda m: m["decode_dns_name"](DNS_QUERY, 12)),
+)
+
+
+def timed(fn, mod):
+    t0 = time.ticks_us()
+    for _ in range(ROUNDS):
+        fn(mod)
+    return time.ticks_diff(time.ticks_us(), t0) / ROUNDS
+
+
+fast = hotpath.__dict__
+failures = 0
+for name, fn in CASES:
+    ok = fn(fast) == fn(plain)
+    if not ok:
+        failures += 1
+    t_plain = timed(fn, plain)
+    t_fast = timed(fn, fast)
+    print(
+        "%-16s %-4s plain=%7.1fus native=%7.1fus x%.1f"
+        % (name, "ok" if ok else "FAIL", t_plain, t_fast, t_plain / max(t_fast, 0.1))
+    )
+print("conformance:", "FAIL (%d)" % failures if failures else "ok")
@@ -0,0 +1,54 @@
+# Bytes on the wire and time to fetch the render-blocking assets (index.html,
+# style.css, app.js) from a running bridge. Runs on the host, not the Pico:
+#   python3 bench_http_assets.py 192.168.4.1
+# "plain" approximates the old behavior (no gzip, no revalidation), "gzip" a
+# first visit and "revalidate" a repeat visit sending the cached ETags.
+import http.client
+import sys
+import time
+
+ASSETS = ("/", "/style.css?v=bench", "/app.js?v=bench")
+ROUNDS = 5
+
+
+def load(host, gzip, etags):
+    conn = http.client.HTTPConnection(host, 80, timeout=10)
+    total = 0
+    t0 = time.perf_counter()
+    for path in ASSETS:
+        headers = {"Accept-Encoding": "gzip" if gzip else "identity"}
+        if path in etags:
+            headers["If-None-Match"] = etags[path]
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        body = resp.read()
+        total += len(body) + sum(len(k) + len(v) + 4 for k, v in resp.getheaders())
+        if resp.getheader("ETag"):
+            etags[path] = resp.getheader("ETag")
+        if resp.getheader("Connection", "").lower() == "close":
+            conn.close()
+            conn = http.client.HTTPConnection(host, 80, timeout=10)
+    conn.close()
+    return total, (time.perf_counter() - t0) * 1000
+
+
+def main():
+    host = sys.argv[1] if len(sys.argv) > 1 else "192.168.4.1"
+    for name, gzip, revalidate in (
+        ("plain", False, False),
+        ("gzip", True, False),
+        ("revalidate", True, True),
+    ):
+        etags = {}
+        if revalidate:
+            load(host, gzip, etags)
+        samples = []
+        size = 0
+        for _ in range(ROUNDS):
+            size, ms = load(host, gzip, dict(etags))
+            samples.append(ms)
+        samples.sort()
+        print("%-10s %6d bytes  median %6.0f ms" % (name, size, samples[len(samples) // 2]))
+
+
+main()
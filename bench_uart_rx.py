@@ -0,0 +1,65 @@
+# UART line -> WebSocket broadcast latency, poll vs stream receive.
+# Needs main.py/config.py on the Pico and a jumper from UART TX to RX
+# (GP16 -> GP17 by default). Run with: mpremote run bench_uart_rx.py
+import time
+import uasyncio as asyncio
+import main
+
+SAMPLES = 50
+
+
+class Probe:
+    # Stands in for a WebSocket client and timestamps each STATE broadcast.
+    def __init__(self):
+        self.event = asyncio.Event()
+        self.t_us = 0
+        self.awaiting = set()
+        self.compress = False
+
+    def wants(self, kind):
+        return True
+
+    def enqueue(self, frame, kind=None, payload=None):
+        if kind == "state":
+            self.t_us = time.ticks_us()
+            self.event.set()
+        return True
+
+
+async def run_mode(uart, mode):
+    probe = Probe()
+    main.clients.add(probe)
+    task = asyncio.create_task(main.uart_reader_task(uart, mode))
+    await asyncio.sleep_ms(100)
+    samples = []
+    for i in range(SAMPLES):
+        probe.event.clear()
+        t0 = time.ticks_us()
+        uart.write(("STATE VOL=%d\r\n" % i).encode("utf-8"))
+        try:
+            await asyncio.wait_for_ms(probe.event.wait(), 500)
+        except asyncio.TimeoutError:
+            continue
+        samples.append(time.ticks_diff(probe.t_us, t0))
+        # Vary the phase against the poll interval.
+        await asyncio.sleep_ms(5 + (i * 7) % 13)
+    task.cancel()
+    main.clients.discard(probe)
+    await asyncio.sleep_ms(20)
+    if not samples:
+        print(mode, ": no samples (is TX jumpered to RX?)")
+        return
+    samples.sort()
+    print(
+        "%-6s n=%d min=%dus median=%dus max=%dus"
+        % (mode, len(samples), samples[0], samples[len(samples) // 2], samples[-1])
+    )
+
+
+async def bench():
+    uart = main.uart_init()
+    for mode in ("poll", "stream"):
+        await run_mode(uart, mode)
+
+
+asyncio.run(bench())
@@ -0,0 +1,224 @@
+# Drives main.uart_writer_task against a fake UART that records every write,
+# checks how queued lines are packed into batches and reports throughput
+# against the UART line rate. Also checks that /api/cmd?wait=1 answers a GET
+# queued after a SET with the post-SET reply. Runs on the host, not the Pico:
+#   python3 bench_uart_tx.py
+# The shims below stand in for the MicroPython modules main.py imports.
+import asyncio
+import sys
+import time
+import types
+
+_t0 = time.monotonic()
+time.ticks_ms = lambda: int((time.monotonic() - _t0) * 1000)
+time.ticks_us = lambda: int((time.monotonic() - _t0) * 1000000)
+time.ticks_diff = lambda a, b: a - b
+time.ticks_add = lambda a, b: a + b
+
+
+async def _sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def _wait_for_ms(aw, ms):
+    return await asyncio.wait_for(aw, ms / 1000)
+
+
+asyncio.sleep_ms = _sleep_ms
+asyncio.wait_for_ms = _wait_for_ms
+sys.modules["uasyncio"] = asyncio
+sys.modules["ubinascii"] = __import__("binascii")
+sys.modules["uhashlib"] = __import__("hashlib")
+sys.modules["network"] = types.ModuleType("network")
+_machine = types.ModuleType("machine")
+_machine.UART = _machine.Pin = object
+sys.modules["machine"] = _machine
+
+import main  # noqa: E402
+
+main.log = lambda *args: None
+
+BATCH = main.UART_TX_BATCH_BYTES
+LINE_RATE = main.UART_BAUD // main.UART_CHAR_BITS
+BENCH_LINES = 400
+
+
+class RecordingUart:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        return len(data)
+
+
+async def run_writer(lines):
+    # Queue lines (waiting while the queue is full) and collect the writes.
+    uart = RecordingUart()
+    task = asyncio.ensure_future(main.uart_writer_task(uart))
+    await asyncio.sleep(0)
+    t0 = time.monotonic()
+    for line in lines:
+        while len(main.uart_tx) >= main.uart_tx.limit:
+            await asyncio.sleep(0.001)
+        main.uart_send(uart, line)
+    expected = sum(len(main.uart_tx_encode(line)) for line in lines)
+    while sum(len(w) for w in uart.writes) < expected:
+        await asyncio.sleep(0.001)
+    # The writer sleeps off the last batch's wire time before it is done.
+    await asyncio.sleep(main.uart_wire_ms(len(uart.writes[-1])) / 1000)
+    elapsed = time.monotonic() - t0
+    task.cancel()
+    return uart.writes, elapsed
+
+
+def split_lines(data):
+    return [line + b"\r\n" for line in data.split(b"\r\n")[:-1]]
+
+
+def check_batches(lines, writes):
+    encoded = [main.uart_tx_encode(line) for line in lines]
+    assert b"".join(writes) == b"".join(encoded), "bytes lost or reordered"
+    i = 0
+    for k, data in enumerate(writes):
+        got = split_lines(data)
+        assert got == encoded[i : i + len(got)], "line split across writes"
+        i += len(got)
+        if len(data) > BATCH:
+            assert len(got) == 1, "oversized line shared a write"
+        elif i < len(encoded) and k + 1 < len(writes):
+            # A batch only closes early when the next line would not fit.
+            assert len(data) + len(encoded[i]) > BATCH, "batch closed early"
+    return len(writes)
+
+
+def case_boundaries():
+    lines = ["NOTE %03d %s" % (i, "x" * (1 + i % 23)) for i in range(24)]
+    writes, _ = asyncio.run(run_writer(lines))
+    check_batches(lines, writes)
+    assert len(writes) > 1 and max(len(w) for w in writes) <= BATCH
+    return "%d lines -> %d writes" % (len(lines), len(writes))
+
+
+def case_carry():
+    # Two lines fill the buffer exactly; the third must open the next write.
+    body = BATCH // 2 - len("NOTE a \r\n")
+    lines = ["NOTE a " + "a" * body, "NOTE b " + "b" * body, "NOTE c"]
+    writes, _ = asyncio.run(run_writer(lines))
+    check_batches(lines, writes)
+    assert len(writes[0]) == BATCH and split_lines(writes[1])[0] == b"NOTE c\r\n"
+    return "carry -> %s" % [len(w) for w in writes]
+
+
+def case_oversized():
+    big = "NOTE big " + "z" * (BATCH + 40)
+    lines = ["NOTE before", big, "NOTE after"]
+    writes, _ = asyncio.run(run_writer(lines))
+    check_batches(lines, writes)
+    assert main.uart_tx_encode(big) in writes, "oversized line not written alone"
+    return "oversized -> %s" % [len(w) for w in writes]
+
+
+def case_write_error():
+    # A failed write reports back to each command's sender.
+    class Client:
+        def __init__(self):
+            self.got = []
+
+        def text_frame(self, payload):
+            return payload
+
+        def enqueue(self, frame, kind, payload):
+            self.got.append(payload)
+
+    class FailingUart(RecordingUart):
+        def write(self, data):
+            raise OSError(5)
+
+    async def go(client):
+        task = asyncio.ensure_future(main.uart_writer_task(FailingUart()))
+        await asyncio.sleep(0)
+        main.uart_send(None, "NOTE one", client)
+        main.uart_send(None, "NOTE two", client)
+        await asyncio.sleep(0.05)
+        task.cancel()
+
+    client = Client()
+    main.clients.add(client)
+    try:
+        asyncio.run(go(client))
+    finally:
+        main.clients.discard(client)
+    assert client.got == [b"ERR UART_WRITE"] * 2, "failure not reported: %s" % client.got
+    return "2 lines -> %d errors reported" % len(client.got)
+
+
+def case_set_then_get():
+    # A GET behind a SET must not be answered from the pre-SET cache.
+    class FakePreamp:
+        def __init__(self):
+            self.vol = 1
+
+        def write(self, data):
+            for cmd in bytes(data).decode().split("\r\n"):
+                if cmd.startswith("SET VOL "):
+                    self.vol = int(cmd[8:])
+                    out = ["ACK VOL %d" % self.vol, "STATE VOL=%d" % self.vol]
+                elif cmd == "GET STATE":
+                    out = ["STATE VOL=%d" % self.vol]
+                else:
+                    continue
+                asyncio.get_event_loop().call_later(0.005, main.dispatch_uart_frames, out)
+
+    async def go():
+        preamp = FakePreamp()
+        task = asyncio.ensure_future(main.uart_writer_task(preamp))
+        # Let the earlier cases' writes settle so the cache may answer again.
+        await asyncio.sleep(main.UART_TX_ACK_TIMEOUT_MS / 1000)
+        main.dispatch_uart_frames(["STATE VOL=1"])
+        assert main.cached_get_reply("state") == "STATE VOL=1", "cache not primed"
+        results = await main.run_commands_waiting(preamp, ["SET VOL 5", "GET STATE"])
+        task.cancel()
+        return results
+
+    results = asyncio.run(go())
+    assert results[1]["reply"] == "STATE VOL=5", "stale GET reply: %s" % results[1]["reply"]
+    return "GET STATE after SET -> %s" % results[1]["reply"]
+
+
+def case_throughput():
+    lines = ["NOTE %03d %s" % (i, "n" * (1 + i % 17)) for i in range(BENCH_LINES)]
+    writes, elapsed = asyncio.run(run_writer(lines))
+    check_batches(lines, writes)
+    total = sum(len(w) for w in writes)
+    rate = total / elapsed
+    return "%d bytes in %d writes, %.0f B/s = %.0f%% of %d B/s line rate (%d ms/line pace)" % (
+        total,
+        len(writes),
+        rate,
+        100 * rate / LINE_RATE,
+        LINE_RATE,
+        main.UART_TX_LINE_PACE_MS,
+    )
+
+
+def bench():
+    failures = 0
+    for name, case in (
+        ("boundaries", case_boundaries),
+        ("carry", case_carry),
+        ("oversized", case_oversized),
+        ("write_error", case_write_error),
+        ("set_then_get", case_set_then_get),
+        ("throughput", case_throughput),
+    ):
+        try:
+            print("%-13s ok    %s" % (name, case()))
+        except AssertionError as exc:
+            failures += 1
+            print("%-13s FAIL  %s" % (name, exc))
+    print("conformance:", "FAIL (%d)" % failures if failures else "ok")
+    sys.exit(1 if failures else 0)
+
+
+bench()
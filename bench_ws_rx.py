@@ -0,0 +1,59 @@
+# Heap bytes allocated and time per WebSocket.recv() for typical client frames.
+# Needs main.py/config.py on the Pico. Run with: mpremote run bench_ws_rx.py
+# Run it against an older main.py as well to compare before/after.
+import gc
+import os
+import time
+import uasyncio as asyncio
+import main
+
+FRAMES = 200
+MESSAGES = (b"SET VOL 12", b"GET STATE", b"SET TUBE 3 ACT=Y HOUR=120 MIN=15")
+
+
+def masked_frame(payload):
+    mask = os.urandom(4)
+    body = bytearray(payload)
+    for i in range(len(body)):
+        body[i] ^= mask[i & 3]
+    return bytes((0x81, 0x80 | len(payload))) + mask + bytes(body)
+
+
+class MemReader:
+    # In-memory stand-in for the socket stream; supports both read paths.
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.pos = 0
+
+    async def read(self, n):
+        chunk = bytes(self.data[self.pos : self.pos + n])
+        self.pos += len(chunk)
+        return chunk
+
+    async def readinto(self, buf):
+        n = min(len(buf), len(self.data) - self.pos)
+        buf[:n] = self.data[self.pos : self.pos + n]
+        self.pos += n
+        return n
+
+
+async def bench():
+    for payload in MESSAGES:
+        data = b"".join([masked_frame(payload) for _ in range(FRAMES)])
+        ws = main.WebSocket(MemReader(data), None)
+        gc.collect()
+        gc.disable()
+        before = gc.mem_alloc()
+        t0 = time.ticks_us()
+        for _ in range(FRAMES):
+            await ws.recv()
+        elapsed = time.ticks_diff(time.ticks_us(), t0)
+        allocated = gc.mem_alloc() - before
+        gc.enable()
+        print(
+            "%-34s %4d B/frame %5d us/frame"
+            % (payload.decode(), allocated // FRAMES, elapsed // FRAMES)
+        )
+
+
+asyncio.run(bench())
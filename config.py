@@ -21,6 +21,28 @@ WIFI_CONNECT_TIMEOUT_MS = 10_000
 # HTTP server
 HTTP_HOST = "0.0.0.0"
 HTTP_PORT = 80
+# Keep-alive: a connection closes after HTTP_KEEPALIVE_IDLE_MS without a new
+# request, or once it has served HTTP_KEEPALIVE_MAX_REQUESTS requests.
+HTTP_KEEPALIVE_IDLE_MS = 5000
+HTTP_KEEPALIVE_MAX_REQUESTS = 16
+# Gzipped static files held in RAM after first use (0 disables); sized for
+# the .gz copies of index.html, app.js and style.css (about 11.4 KB). Cached
+# files are dropped when gc.mem_free() falls below the low-water mark; they
+# are sent to the socket in slices of ASSET_SEND_CHUNK bytes.
+ASSET_CACHE_BYTES = 12_000
+ASSET_CACHE_LOW_WATER = 40_000
+ASSET_SEND_CHUNK = 4096
+# /api/wait long-poll: how long a request may park waiting for a new line,
+# and how many may be parked at once.
+HTTP_WAIT_TIMEOUT_MS = 20_000
+HTTP_WAIT_MAX_PARKED = 4
+# /api/stream Server-Sent Events: concurrent streams allowed and the interval
+# of the keepalive comment sent when no lines have gone out.
+SSE_MAX_STREAMS = 2
+SSE_HEARTBEAT_S = 15
+# POST /api/cmd?wait=1 holds the response until each command's ACK/ERR/reply
+# line arrives, or this long at most.
+HTTP_CMD_WAIT_TIMEOUT_MS = 1500
 
 # UART configuration (bridge -> preamp controller)
 UART_ID = 0
@@ -40,6 +62,46 @@ BRI_MIN = 1
 BRI_MAX = 8
 
 # Behavior
+# UART receive: "stream" wakes on RX via asyncio.StreamReader, "poll" checks
+# uart.any() every UART_POLL_MS. Partial frames flush after the idle timeout.
+UART_RX_MODE = "stream"
 UART_POLL_MS = 10
+UART_RX_IDLE_FLUSH_MS = 50
+UART_RX_BUFFER_SIZE = 1024
+UART_TX_QUEUE_LIMIT = 32
+# UART transmit flow control: 0 paces writes 2 ms apart; N > 0 keeps up to N
+# commands in flight and sends the next when an ACK/ERR/reply arrives.
+UART_TX_CREDITS = 0
+UART_TX_ACK_TIMEOUT_MS = 300
+# Ready lines are joined into one write of at most this many bytes. A batch
+# arrives back to back, so keep it within the preamp's serial receive buffer
+# (64 bytes is the Arduino default); 0 writes one line at a time.
+UART_TX_BATCH_BYTES = 64
+# Each line gets at least this long before the next write, so the preamp
+# parses a batch from its buffer at the old one-line-per-2-ms pace.
+UART_TX_LINE_PACE_MS = 2
 UART_STARTUP_SYNC_DELAY_MS = 500
+# GET STATE/SELECTOR_LABELS/AMP_STATES are answered from the bridge's cache,
+# without asking the preamp, while its last reply is younger than this.
+GET_CACHE_TTL_MS = 1000
+# A GET TUBES reply is collected aside and swapped in on END TUBES; one not
+# finished within this long is discarded and the previous table kept.
+TUBES_STAGING_TIMEOUT_MS = 3000
+# Quiet WebSocket clients are pinged after WS_PING_INTERVAL_S and dropped if
+# nothing arrives within WS_PONG_TIMEOUT_S of the ping.
 WS_PING_INTERVAL_S = 25
+WS_PONG_TIMEOUT_S = 10
+# Largest client frame payload; each connection preallocates this much.
+WS_RX_MAX_PAYLOAD = 512
+# Frames queued per WebSocket client before it is treated as too slow.
+WS_SEND_QUEUE_LIMIT = 24
+# Extra wait before a batching client's frame is sent (0 = one scheduler tick).
+WS_BATCH_WINDOW_MS = 0
+# Recent broadcast lines kept so reconnecting clients get only what they missed.
+WS_EVENT_RING_SIZE = 64
+# permessage-deflate for WebSocket text frames. Needs a MicroPython build with
+# deflate compression; frames below WS_DEFLATE_MIN_BYTES are sent plain.
+# WS_DEFLATE_WBITS bounds the sliding window (2**bits bytes) each way.
+WS_DEFLATE = True
+WS_DEFLATE_MIN_BYTES = 64
+WS_DEFLATE_WBITS = 9
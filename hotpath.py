@@ -0,0 +1,111 @@
+# Byte-twiddling inner loops used by main.py, compiled to machine code on
+# MicroPython by the native/viper emitters. Off-device the shim below turns
+# the decorators into no-ops so the same source runs as plain Python.
+# bench_hotpath.py checks the compiled and plain versions agree.
+try:
+    import micropython
+except ImportError:
+
+    class micropython:
+        @staticmethod
+        def native(f):
+            return f
+
+        @staticmethod
+        def viper(f):
+            return f
+
+    def ptr8(buf):
+        return buf
+
+
+@micropython.viper
+def unmask(buf, n: int, mask):
+    # XOR the first n bytes of buf in place with the 4-byte client mask.
+    b = ptr8(buf)
+    m = ptr8(mask)
+    for i in range(n):
+        b[i] = b[i] ^ m[i & 3]
+
+
+@micropython.native
+def ws_header(b1, length):
+    if length < 126:
+        return bytes((b1, length))
+    if length < 65536:
+        return bytes((b1, 126, (length >> 8) & 0xFF, length & 0xFF))
+    header = bytearray(10)
+    header[0] = b1
+    header[1] = 127
+    for k in range(8):
+        header[9 - k] = (length >> (k * 8)) & 0xFF
+    return bytes(header)
+
+
+@micropython.native
+def match_marker(buf, i, end, candidates):
+    # 1 = marker starts at i, 0 = no marker, -1 = need more bytes to tell.
+    if not candidates:
+        return 0
+    avail = end - i
+    result = 0
+    for marker in candidates:
+        n = len(marker)
+        k = 1
+        limit = n if n < avail else avail
+        while k < limit and buf[i + k] == marker[k]:
+            k += 1
+        if k == n:
+            return 1
+        if k == avail:
+            result = -1
+    return result
+
+
+@micropython.native
+def url_decode(value):
+    value = value.replace("+", " ")
+    out = ""
+    i = 0
+    while i < len(value):
+        ch = value[i]
+        if ch == "%" and i + 2 < len(value):
+            try:
+                out += chr(int(value[i + 1 : i + 3], 16))
+                i += 3
+                continue
+            except Exception:
+                pass
+        out += ch
+        i += 1
+    return out
+
+
+@micropython.native
+def decode_dns_name(data, offset):
+    labels = []
+    jumped = False
+    jump_offset = 0
+    while True:
+        if offset >= len(data):
+            return "", offset
+        length = data[offset]
+        if length == 0:
+            offset += 1
+            break
+        if length & 0xC0:
+            if offset + 1 >= len(data):
+                return "", offset + 1
+            pointer = ((length & 0x3F) << 8) | data[offset + 1]
+            if not jumped:
+                jump_offset = offset + 2
+                jumped = True
+            offset = pointer
+            continue
+        offset += 1
+        if offset + length > len(data):
+            return "", offset + length
+        labels.append(data[offset : offset + length].decode("utf-8"))
+        offset += length
+    name = ".".join(labels)
+    return name, (jump_offset if jumped else offset)
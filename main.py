@@ -8,8 +8,19 @@ import machine
 import socket
 import gc
 import os
+import io
+from collections import deque
 from machine import UART, Pin
 
+try:
+    import deflate
+except ImportError:
+    deflate = None
+    try:
+        import zlib
+    except ImportError:
+        zlib = None
+
 from config import (
     WIFI_MODE,
     WIFI_SSID,
@@ -21,6 +32,16 @@ from config import (
     WIFI_CONNECT_TIMEOUT_MS,
     HTTP_HOST,
     HTTP_PORT,
+    HTTP_KEEPALIVE_IDLE_MS,
+    HTTP_KEEPALIVE_MAX_REQUESTS,
+    ASSET_CACHE_BYTES,
+    ASSET_CACHE_LOW_WATER,
+    ASSET_SEND_CHUNK,
+    HTTP_WAIT_TIMEOUT_MS,
+    HTTP_WAIT_MAX_PARKED,
+    SSE_MAX_STREAMS,
+    SSE_HEARTBEAT_S,
+    HTTP_CMD_WAIT_TIMEOUT_MS,
     UART_ID,
     UART_BAUD,
     UART_BITS,
@@ -29,30 +50,121 @@ from config import (
     UART_TX_PIN,
     UART_RX_PIN,
     UART_POLL_MS,
-    UART_STARTUP_SYNC_DELAY_MS
+    UART_RX_BUFFER_SIZE,
+    UART_RX_MODE,
+    UART_RX_IDLE_FLUSH_MS,
+    UART_TX_QUEUE_LIMIT,
+    UART_TX_CREDITS,
+    UART_TX_ACK_TIMEOUT_MS,
+    UART_TX_BATCH_BYTES,
+    UART_TX_LINE_PACE_MS,
+    WS_SEND_QUEUE_LIMIT,
+    WS_BATCH_WINDOW_MS,
+    WS_EVENT_RING_SIZE,
+    WS_DEFLATE,
+    WS_DEFLATE_MIN_BYTES,
+    WS_DEFLATE_WBITS,
+    WS_PING_INTERVAL_S,
+    WS_PONG_TIMEOUT_S,
+    WS_RX_MAX_PAYLOAD,
+    UART_STARTUP_SYNC_DELAY_MS,
+    GET_CACHE_TTL_MS,
+    TUBES_STAGING_TIMEOUT_MS,
 )
+from hotpath import unmask, ws_header, match_marker, url_decode, decode_dns_name
 
 WS_MAGIC = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Sec-WebSocket-Protocol value for clients that accept newline-joined frames.
+WS_BATCH_PROTOCOL = "batch.lines"
+# Largest inflated client message accepted under permessage-deflate.
+WS_INFLATE_LIMIT = 4096
 DNS_PORT = 53
+STATIC_FILES = ("web/index.html", "web/app.js", "web/style.css")
 
 clients = set()
+# Open /api/stream (Server-Sent Events) connections.
+streams = set()
+sse_stats = {"opened": 0, "resumed": 0, "evicted": 0, "rejected": 0}
+fanout_stats = {
+    "frames": 0,
+    "queued": 0,
+    "coalesced": 0,
+    "evicted": 0,
+    "batch_frames_saved": 0,
+    "batch_bytes_saved": 0,
+    "suppressed": 0,
+    "resumed": 0,
+    "resume_misses": 0,
+    "filtered": 0,
+}
+keepalive_stats = {"pings": 0, "reaped": 0}
+http_stats = {
+    "connections": 0,
+    "requests": 0,
+    "reused": 0,
+    "idle_closed": 0,
+    "waits": 0,
+    "wait_timeouts": 0,
+    "wait_rejected": 0,
+    "wait_abandoned": 0,
+    "cmd_batches": 0,
+    "cmd_waits": 0,
+    "cmd_wait_timeouts": 0,
+}
+deflate_stats = {"messages": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "us_total": 0}
+# Recent broadcast lines as [seq, kind, payload], indexed by seq % size.
+event_ring = [None] * WS_EVENT_RING_SIZE
+event_seq = 0
+# Set (and replaced) whenever a line is recorded; /api/wait requests park on it.
+event_wake = None
+wait_parked = 0
+# Distinguishes sequence numbers from before a bridge reboot.
+boot_id = ubinascii.hexlify(os.urandom(4)).decode()
 last_state_line = None
 last_labels_line = None
 last_amp_states_line = None
 tube_lines = {}
 tubes_end_seen = False
+# Table being filled by a GET TUBES reply; readers only ever see tube_lines.
+tube_staging = None
+tube_staging_ms = 0
+tube_stats = {"swaps": 0, "abandoned": 0}
+# name -> [versions, bytes] for ready-to-send snapshot payloads; rebuilt on the
+# first use after a version they depend on changes.
+payload_cache = {}
+payload_stats = {"hits": 0, "builds": 0}
+# path -> (size, mtime, etag) for served static files and their .gz siblings.
+asset_etags = {}
+# path -> [size, mtime, memoryview, last_use] for files held in RAM.
+asset_cache = {}
+asset_cache_stats = {"hits": 0, "misses": 0, "evictions": 0, "low_mem_drops": 0, "mem_errors": 0}
+asset_cache_bytes = 0
+asset_cache_clock = 0
+# Bumped whenever the cached value of a category actually changes.
+state_versions = {"state": 0, "labels": 0, "amp_states": 0, "tubes": 0}
 ap_setup_mode = False
 ap_page_ssid = ""
-uart_rx_buffer = ""
 uart_last_rx_ms = 0
-uart_tx_queue = []
 uart_tx_event = None
+# CommandWaiters for /api/cmd?wait=1 requests, oldest first.
+cmd_waiters = []
+uart_tx_inflight = []
+# When a state-changing (non-GET) command was last written to the UART.
+uart_tx_change_ms = None
+# When a write last went out untracked (credits off, no waiters).
+uart_tx_untracked_ms = None
+uart_flow_stats = {"acked": 0, "errors": 0, "timeouts": 0, "rtt_ms_total": 0, "rtt_ms_max": 0}
+# GET command -> when it was sent; cleared once its reply arrives.
 uart_last_get_ms = {}
+# Reply kind -> when its line last arrived from the preamp.
+get_fresh_ms = {}
+get_cache_stats = {"hits": 0, "misses": 0}
 sta_status = "idle"
 sta_ip = ""
 sta_wlan = None
 sta_task = None
 
+# A GET still awaiting its reply is not sent again within this window.
 GET_DEDUP_MS = 350
 GET_DEDUP_COMMANDS = (
     "GET STATE",
@@ -60,6 +172,42 @@ GET_DEDUP_COMMANDS = (
     "GET AMP_STATES",
     "GET TUBES",
 )
+# Idempotent SETs: a newer value replaces a queued one in place.
+SET_COALESCE_KEYS = ("VOL", "BAL", "INP", "MUTE", "BRI", "STBY")
+# UART transmit classes, drained strictly in this order.
+TX_CLASS_INTERACTIVE = 0
+TX_CLASS_BULK = 1
+TX_CLASS_NAMES = ("interactive", "bulk")
+# Broadcast kinds where only the latest queued frame per client matters.
+WS_COALESCE_KINDS = ("state", "labels", "amp_states")
+# Subscription topic for each handle_uart_line kind.
+WS_TOPICS = {
+    "state": "state",
+    "labels": "labels",
+    "amp_states": "amp_states",
+    "tube": "tube",
+    "tubes_end": "tube",
+    "other": "other",
+}
+# Cached reply kind for each GET a client may issue.
+GET_REPLY_KINDS = {
+    "GET STATE": "state",
+    "GET SELECTOR_LABELS": "labels",
+    "GET AMP_STATES": "amp_states",
+}
+GET_REPLY_COMMANDS = {kind: cmd for cmd, kind in GET_REPLY_KINDS.items()}
+# Cached-data endpoints and the state_versions their bodies depend on.
+API_PAYLOAD_KINDS = {
+    "/api/state": ("state",),
+    "/api/labels": ("labels",),
+    "/api/amp_states": ("amp_states",),
+    "/api/tubes": ("tubes",),
+    "/api/snapshot": ("state", "labels", "amp_states", "tubes"),
+}
+SNAPSHOT_KINDS = API_PAYLOAD_KINDS["/api/snapshot"]
+# Bits on the wire per UART character (start + data + parity + stop).
+UART_CHAR_BITS = 1 + UART_BITS + (0 if UART_PARITY is None else 1) + UART_STOP
+UART_TX_PREENCODED = {cmd: (cmd + "\r\n").encode("utf-8") for cmd in GET_DEDUP_COMMANDS}
 
 
 WLAN_STAT_IDLE = getattr(network, "STAT_IDLE", 0)
@@ -380,50 +528,459 @@ def uart_init():
     return uart
 
 
-def uart_send(uart, line):
-    global tube_lines, tubes_end_seen, uart_tx_event, uart_last_get_ms
+def set_coalesce_key(cmd):
+    parts = cmd.split()
+    if len(parts) == 3 and parts[0] == "SET" and parts[1] in SET_COALESCE_KEYS:
+        return parts[1]
+    return None
+
+
+class UartTxScheduler:
+    # Two-class transmit queue: user SET/ADD/DEL commands go out ahead of
+    # GET refreshes. Entries are [text, cmd, class, enqueued_ms, origin].
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.queues = (deque((), limit), deque((), limit))
+        self.depths = [0, 0]
+        self.queued_gets = set()
+        self.set_slots = {}
+        self.counters = {
+            "queued": 0,
+            "written": 0,
+            "coalesced": 0,
+            "get_deduped": 0,
+            "batches": 0,
+            "bytes": 0,
+        }
+        self.class_stats = []
+        for _ in TX_CLASS_NAMES:
+            self.class_stats.append(
+                {"depth_max": 0, "sent": 0, "dropped": 0, "wait_ms_total": 0, "wait_ms_max": 0}
+            )
+
+    def __len__(self):
+        return self.depths[0] + self.depths[1]
+
+    def fits(self, cmds):
+        # Whether push() would take every command in cmds (upper-cased).
+        need = [0, 0]
+        slots = set(self.set_slots)
+        gets = set(self.queued_gets)
+        for cmd in cmds:
+            if cmd.startswith("GET "):
+                if cmd not in gets:
+                    gets.add(cmd)
+                    need[TX_CLASS_BULK] += 1
+                continue
+            key = set_coalesce_key(cmd)
+            if key is not None:
+                if key in slots:
+                    continue
+                slots.add(key)
+            elif cmd.startswith("ADD ") or cmd.startswith("DEL "):
+                slots.clear()
+            need[TX_CLASS_INTERACTIVE] += 1
+        for cls in (TX_CLASS_INTERACTIVE, TX_CLASS_BULK):
+            if self.depths[cls] + need[cls] > self.limit:
+                return False
+        return True
+
+    def is_queued(self, cmd):
+        return cmd in self.queued_gets
+
+    def push(self, text, cmd, origin=None):
+        cls = TX_CLASS_BULK if cmd.startswith("GET ") else TX_CLASS_INTERACTIVE
+        key = set_coalesce_key(cmd)
+        if key is not None:
+            slot = self.set_slots.get(key)
+            if slot is not None:
+                # Latest value wins but keeps the original place in line.
+                slot[0] = text
+                slot[1] = cmd
+                slot[4] = origin
+                self.counters["coalesced"] += 1
+                return True
+        stats = self.class_stats[cls]
+        if self.depths[cls] >= self.limit:
+            # Drop policy: a full class rejects the newest command.
+            stats["dropped"] += 1
+            log("UART tx queue full; dropped", text)
+            return False
+        entry = [text, cmd, cls, time.ticks_ms(), origin]
+        if key is not None:
+            self.set_slots[key] = entry
+        elif cmd.startswith("ADD ") or cmd.startswith("DEL "):
+            # Not idempotent: later SETs must not coalesce ahead of these.
+            self.set_slots.clear()
+        self.queues[cls].append(entry)
+        if cls == TX_CLASS_BULK:
+            self.queued_gets.add(cmd)
+        self.depths[cls] += 1
+        if self.depths[cls] > stats["depth_max"]:
+            stats["depth_max"] = self.depths[cls]
+        self.counters["queued"] += 1
+        return True
+
+    def pop(self):
+        for cls in (TX_CLASS_INTERACTIVE, TX_CLASS_BULK):
+            if self.depths[cls]:
+                break
+        else:
+            return None
+        entry = self.queues[cls].popleft()
+        self.depths[cls] -= 1
+        cmd = entry[1]
+        if cls == TX_CLASS_BULK:
+            self.queued_gets.discard(cmd)
+        key = set_coalesce_key(cmd)
+        if key is not None and self.set_slots.get(key) is entry:
+            del self.set_slots[key]
+        stats = self.class_stats[cls]
+        waited = time.ticks_diff(time.ticks_ms(), entry[3])
+        stats["sent"] += 1
+        stats["wait_ms_total"] += waited
+        if waited > stats["wait_ms_max"]:
+            stats["wait_ms_max"] = waited
+        return entry
+
+    def stats(self):
+        out = dict(self.counters)
+        for cls in (TX_CLASS_INTERACTIVE, TX_CLASS_BULK):
+            stats = dict(self.class_stats[cls])
+            stats["depth"] = self.depths[cls]
+            out[TX_CLASS_NAMES[cls]] = stats
+        return out
+
+
+uart_tx = UartTxScheduler(UART_TX_QUEUE_LIMIT)
+
+
+def uart_send(uart, line, origin=None):
+    # False only when the transmit queue rejected the line.
+    global uart_tx_event, uart_last_get_ms
     cmd = line.strip().upper()
-    if cmd == "GET TUBES":
-        tube_lines = {}
-        tubes_end_seen = False
     text = line.strip()
     if not text:
-        return
+        return True
 
     if cmd in GET_DEDUP_COMMANDS:
-        for queued in uart_tx_queue:
-            if queued.upper() == cmd:
-                return
+        if uart_tx.is_queued(cmd):
+            uart_tx.counters["get_deduped"] += 1
+            return True
         now = time.ticks_ms()
         last = uart_last_get_ms.get(cmd)
         if last is not None and time.ticks_diff(now, last) < GET_DEDUP_MS:
-            return
+            uart_tx.counters["get_deduped"] += 1
+            return True
         uart_last_get_ms[cmd] = now
 
-    uart_tx_queue.append(text)
+    if not uart_tx.push(text, cmd, origin):
+        return False
+    if not cmd.startswith("GET "):
+        # Cached replies predate this change; the next GET must ask the preamp.
+        get_fresh_ms.clear()
     if uart_tx_event is not None:
         try:
             uart_tx_event.set()
         except Exception:
             pass
+    return True
+
+
+def uart_reply_prefixes(cmd):
+    # Reply lines that complete a command in credit-window mode.
+    parts = cmd.split()
+    if len(parts) < 2:
+        return ()
+    verb = parts[0]
+    if verb == "GET":
+        if parts[1] == "TUBES":
+            # Matched against the line dispatch_uart_frames substitutes once
+            # handle_uart_line sees the reply end, embedded or not.
+            return ("END TUBES",)
+        if parts[1] == "TUBE":
+            return ("TUBE ",)
+        return (parts[1],)
+    if verb == "SET":
+        # Not STATE: that may be another client's GET STATE or a front-panel change.
+        return ("ACK " + parts[1],)
+    if verb == "ADD" or verb == "DEL":
+        return ("ACK " + verb,)
+    return ()
+
+
+def uart_tx_release(index, now):
+    entry = uart_tx_inflight.pop(index)
+    rtt = time.ticks_diff(now, entry[2])
+    uart_flow_stats["rtt_ms_total"] += rtt
+    if rtt > uart_flow_stats["rtt_ms_max"]:
+        uart_flow_stats["rtt_ms_max"] = rtt
+    if uart_tx_event is not None:
+        uart_tx_event.set()
+    return entry
+
+
+def uart_tx_match_reply(line):
+    # Returns the in-flight [cmd, prefixes, sent_ms, origin] this reply
+    # completes, or None.
+    if not uart_tx_inflight:
+        return None
+    now = time.ticks_ms()
+    uart_tx_expire(now)
+    if not uart_tx_inflight:
+        return None
+    if line.startswith("ERR"):
+        # ERR lines do not name the command; the preamp answers in order.
+        uart_flow_stats["errors"] += 1
+        return uart_tx_release(0, now)
+    for i in range(len(uart_tx_inflight)):
+        for prefix in uart_tx_inflight[i][1]:
+            if line.startswith(prefix):
+                uart_flow_stats["acked"] += 1
+                return uart_tx_release(i, now)
+    return None
+
+
+def uart_tx_expire(now):
+    # Returns ms until the oldest in-flight command times out.
+    while uart_tx_inflight:
+        age = time.ticks_diff(now, uart_tx_inflight[0][2])
+        if age < UART_TX_ACK_TIMEOUT_MS:
+            return UART_TX_ACK_TIMEOUT_MS - age
+        entry = uart_tx_inflight.pop(0)
+        if UART_TX_CREDITS:
+            uart_flow_stats["timeouts"] += 1
+            log("UART no reply for", entry[0])
+    return UART_TX_ACK_TIMEOUT_MS
+
+
+def cached_line(kind):
+    if kind == "state":
+        return last_state_line
+    if kind == "labels":
+        return last_labels_line
+    if kind == "amp_states":
+        return last_amp_states_line
+    return None
+
+
+def cached_get_reply(kind):
+    # The cached line if the preamp sent it within GET_CACHE_TTL_MS, else None.
+    # Not while a change is queued or may still be unanswered: only a GET
+    # sent to the preamp after it is sure to reflect it.
+    stamp = get_fresh_ms.get(kind)
+    line = cached_line(kind)
+    if (
+        uart_tx.depths[TX_CLASS_INTERACTIVE]
+        or (
+            uart_tx_change_ms is not None
+            and time.ticks_diff(time.ticks_ms(), uart_tx_change_ms) < UART_TX_ACK_TIMEOUT_MS
+        )
+        or stamp is None
+        or line is None
+        or time.ticks_diff(time.ticks_ms(), stamp) >= GET_CACHE_TTL_MS
+    ):
+        get_cache_stats["misses"] += 1
+        return None
+    get_cache_stats["hits"] += 1
+    return line
+
+
+def note_get_reply(kind):
+    # A reply refreshes the cache and ends the in-flight window for its GET.
+    if kind in GET_REPLY_COMMANDS:
+        get_fresh_ms[kind] = time.ticks_ms()
+        uart_last_get_ms.pop(GET_REPLY_COMMANDS[kind], None)
+    elif kind == "tubes_end":
+        uart_last_get_ms.pop("GET TUBES", None)
+
+
+class CommandWaiter:
+    # An /api/cmd?wait=1 command waiting for the line that answers it.
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.prefixes = uart_reply_prefixes(cmd.upper())
+        self.event = asyncio.Event()
+        self.reply = None
+        self.start_ms = time.ticks_ms()
+        self.rtt_ms = None
+
+
+def answer_command_waiters(line, done):
+    # done is the in-flight entry uart_tx_match_reply released for line.
+    if not cmd_waiters:
+        return
+    target = None
+    if line.startswith("ERR"):
+        # ERR lines do not name the command, so only claim one that went to
+        # the oldest unanswered written command, with no untracked write
+        # recent enough to be the one answered; otherwise it is ambiguous.
+        if done is not None and done[3] in cmd_waiters:
+            if (
+                uart_tx_untracked_ms is None
+                or time.ticks_diff(done[2], uart_tx_untracked_ms) >= UART_TX_ACK_TIMEOUT_MS
+            ):
+                target = done[3]
+    else:
+        for waiter in cmd_waiters:
+            for prefix in waiter.prefixes:
+                if line.startswith(prefix):
+                    target = waiter
+                    break
+            if target is not None:
+                break
+    if target is None:
+        return
+    cmd_waiters.remove(target)
+    target.reply = line
+    target.rtt_ms = time.ticks_diff(time.ticks_ms(), target.start_ms)
+    target.event.set()
+
+
+async def run_commands_waiting(uart, cmds):
+    # Send a batch, then collect each command's reply. rtt_ms counts from when
+    # the bridge accepted the command, so it includes time queued for the UART.
+    waiters = []
+    for cmd in cmds:
+        waiter = CommandWaiter(cmd)
+        kind = GET_REPLY_KINDS.get(cmd.upper())
+        line = cached_get_reply(kind) if kind else None
+        if line is not None:
+            waiter.reply = line
+            waiter.rtt_ms = 0
+            waiters.append(waiter)
+            continue
+        cmd_waiters.append(waiter)
+        if not uart_send(uart, cmd, waiter):
+            cmd_waiters.remove(waiter)
+            waiter.reply = "DROPPED"
+        waiters.append(waiter)
+    http_stats["cmd_waits"] += len(waiters)
+    deadline = time.ticks_add(time.ticks_ms(), HTTP_CMD_WAIT_TIMEOUT_MS)
+    results = []
+    for waiter in waiters:
+        remaining = time.ticks_diff(deadline, time.ticks_ms())
+        if waiter.reply is None and remaining > 0:
+            try:
+                await asyncio.wait_for_ms(waiter.event.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        if waiter in cmd_waiters:
+            cmd_waiters.remove(waiter)
+            http_stats["cmd_wait_timeouts"] += 1
+        results.append({"cmd": waiter.cmd, "reply": waiter.reply, "rtt_ms": waiter.rtt_ms})
+    return results
+
+
+def uart_tx_encode(line):
+    data = UART_TX_PREENCODED.get(line)
+    if data is None:
+        data = (line + "\r\n").encode("utf-8")
+    return data
+
+
+def uart_wire_ms(nbytes):
+    # Time the UART needs to shift nbytes out at UART_BAUD, rounded up.
+    return (nbytes * UART_CHAR_BITS * 1000 + UART_BAUD - 1) // UART_BAUD
+
+
+def uart_tx_fail(entry, reply):
+    # Tell whoever queued entry that it never reached the preamp.
+    origin = entry[4]
+    uart_last_get_ms.pop(entry[1], None)
+    if origin in cmd_waiters:
+        cmd_waiters.remove(origin)
+        origin.reply = reply
+        origin.rtt_ms = time.ticks_diff(time.ticks_ms(), origin.start_ms)
+        origin.event.set()
+    elif origin is not None and origin in clients:
+        payload = reply.encode("utf-8")
+        origin.enqueue(origin.text_frame(payload), "other", payload)
 
 
 async def uart_writer_task(uart):
-    global uart_tx_event
+    global uart_tx_event, uart_tx_untracked_ms, uart_tx_change_ms
     uart_tx_event = asyncio.Event()
+    buf = bytearray(UART_TX_BATCH_BYTES)
+    mv = memoryview(buf)
+    carry = None
     while True:
-        if not uart_tx_queue:
+        if UART_TX_CREDITS and len(uart_tx_inflight) >= UART_TX_CREDITS:
+            # Window full: wait for an ACK/ERR, or the oldest to time out.
+            wait_ms = uart_tx_expire(time.ticks_ms())
+            if len(uart_tx_inflight) >= UART_TX_CREDITS:
+                uart_tx_event.clear()
+                try:
+                    await asyncio.wait_for_ms(uart_tx_event.wait(), wait_ms)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+        entry = carry or uart_tx.pop()
+        carry = None
+        if entry is None:
             uart_tx_event.clear()
             await uart_tx_event.wait()
             continue
-        line = uart_tx_queue.pop(0)
+
+        # Drain ready lines into one buffer so they go out in a single write.
+        sent = []
+        data = None
+        n = 0
+        while entry is not None:
+            encoded = uart_tx_encode(entry[0])
+            size = len(encoded)
+            if n + size > UART_TX_BATCH_BYTES:
+                if n:
+                    carry = entry
+                else:
+                    # Oversized line: write it on its own.
+                    data = encoded
+                    n = size
+                    sent.append(entry)
+                break
+            mv[n : n + size] = encoded
+            n += size
+            sent.append(entry)
+            if UART_TX_CREDITS and len(uart_tx_inflight) + len(sent) >= UART_TX_CREDITS:
+                break
+            entry = uart_tx.pop()
+        if data is None:
+            data = mv[:n]
+
         try:
-            uart.write((line + "\r\n").encode("utf-8"))
-            log("UART ->", line)
+            uart.write(data)
         except Exception as exc:
             log("UART write error:", exc)
-        # Pace line writes so receiver line readers do not get overrun.
-        await asyncio.sleep_ms(2)
+            for e in sent:
+                uart_tx_fail(e, "ERR UART_WRITE")
+            continue
+        counters = uart_tx.counters
+        counters["written"] += len(sent)
+        counters["batches"] += 1
+        counters["bytes"] += n
+        if len(sent) == 1:
+            log("UART ->", sent[0][0])
+        else:
+            log("UART ->", " | ".join([e[0] for e in sent]))
+        for e in sent:
+            if e[1] == "GET TUBES":
+                # Stage from when the request is on the wire, not when queued.
+                begin_tubes_generation()
+            elif not e[1].startswith("GET "):
+                uart_tx_change_ms = time.ticks_ms()
+        if UART_TX_CREDITS or cmd_waiters:
+            # Without credits, track writes only while an /api/cmd?wait=1
+            # request needs to know which command an ERR answers.
+            now = time.ticks_ms()
+            uart_tx_expire(now)
+            for e in sent:
+                uart_tx_inflight.append([e[0], uart_reply_prefixes(e[1]), now, e[4]])
+        else:
+            uart_tx_untracked_ms = time.ticks_ms()
+        # Pace by wire time so batches never pile up in the UART TX FIFO, and
+        # by line count so the preamp has parsed the batch before the next.
+        await asyncio.sleep_ms(max(uart_wire_ms(n), UART_TX_LINE_PACE_MS * len(sent)))
 
 
 def parse_tube_num(line):
@@ -455,7 +1012,48 @@ def has_valid_tube_metrics(line):
     return True
 
 
+def begin_tubes_generation():
+    global tube_staging, tube_staging_ms
+    if active_tube_staging() is not None:
+        # A reply is still arriving; let its END TUBES publish it whole.
+        return
+    tube_staging = {}
+    tube_staging_ms = time.ticks_ms()
+
+
+def active_tube_staging():
+    # The staging table, or None if there is none or it has been abandoned.
+    global tube_staging
+    if tube_staging is None:
+        return None
+    if time.ticks_diff(time.ticks_ms(), tube_staging_ms) >= TUBES_STAGING_TIMEOUT_MS:
+        log("Tube table reply timed out; keeping previous table")
+        tube_stats["abandoned"] += 1
+        tube_staging = None
+    return tube_staging
+
+
+def finish_tubes_generation():
+    # END TUBES: publish the staged table in one step.
+    global tube_lines, tube_staging, tubes_end_seen
+    staging = active_tube_staging()
+    changed = not tubes_end_seen
+    if staging is not None:
+        tube_stats["swaps"] += 1
+        if staging != tube_lines:
+            tube_lines = staging
+            changed = True
+        tube_staging = None
+    tubes_end_seen = True
+    if changed:
+        state_versions["tubes"] += 1
+
+
 def render_tubes_lines():
+    return cached_payload("tubes text", ("tubes",), build_tubes_text)
+
+
+def build_tubes_text():
     nums = list(tube_lines.keys())
     nums.sort()
     lines = [tube_lines[num] for num in nums]
@@ -464,6 +1062,150 @@ def render_tubes_lines():
     return "\n".join(lines)
 
 
+def render_snapshot():
+    return cached_payload("snapshot text", SNAPSHOT_KINDS, build_snapshot_text)
+
+
+def build_snapshot_text():
+    # Everything the HTTP fallback needs in one body, one line per record.
+    lines = []
+    for line in (last_state_line, last_labels_line, last_amp_states_line):
+        if line:
+            lines.append(line)
+    tubes = render_tubes_lines()
+    if tubes:
+        lines.append(tubes)
+    return "\n".join(lines)
+
+
+def snapshot_etag():
+    return '"%s-%d-%d-%d-%d"' % (
+        boot_id,
+        state_versions["state"],
+        state_versions["labels"],
+        state_versions["amp_states"],
+        state_versions["tubes"],
+    )
+
+
+def changes_since(params):
+    # Body for /api/wait: a SEQ watermark and the lines after ?since=<seq>, or a
+    # full snapshot if those are gone. None while there is nothing new.
+    try:
+        since = int(params.get("since", "0"))
+    except ValueError:
+        since = 0
+    same_boot = params.get("boot") == boot_id
+    if same_boot and since == event_seq:
+        return None
+    lines = None
+    if same_boot and since >= 0:
+        entries = events_since(since)
+        if entries is not None:
+            lines = [e[2].decode("utf-8") for e in entries]
+    if lines is None:
+        lines = [render_snapshot()]
+    return "\n".join([seq_line()] + lines)
+
+
+async def relay_event(src, dst):
+    await src.wait()
+    dst.set()
+
+
+async def watch_hangup(reader, done, gone):
+    # A parked GET has no body and browsers do not pipeline, so a read that
+    # completes at all means the client went away (e.g. an aborted fetch).
+    try:
+        await reader.read(1)
+    except Exception:
+        pass
+    gone.append(True)
+    done.set()
+
+
+async def wait_for_changes(params, reader):
+    # None if the client hung up while parked.
+    global event_wake, wait_parked
+    body = changes_since(params)
+    if body is not None:
+        return body
+    if event_wake is None:
+        event_wake = asyncio.Event()
+    done = asyncio.Event()
+    gone = []
+    tasks = (
+        asyncio.create_task(relay_event(event_wake, done)),
+        asyncio.create_task(watch_hangup(reader, done, gone)),
+    )
+    wait_parked += 1
+    try:
+        try:
+            await asyncio.wait_for_ms(done.wait(), HTTP_WAIT_TIMEOUT_MS)
+        except asyncio.TimeoutError:
+            http_stats["wait_timeouts"] += 1
+    finally:
+        wait_parked -= 1
+        for task in tasks:
+            task.cancel()
+    if gone:
+        return None
+    # On timeout this is just the unchanged SEQ line.
+    return changes_since(params) or seq_line()
+
+
+def cached_payload(name, kinds, build):
+    version = tuple([state_versions[kind] for kind in kinds])
+    entry = payload_cache.get(name)
+    if entry is not None and entry[0] == version:
+        payload_stats["hits"] += 1
+        return entry[1]
+    data = build()
+    payload_cache[name] = [version, data]
+    payload_stats["builds"] += 1
+    return data
+
+
+def api_payload(path, keep_alive):
+    # Complete HTTP response (headers and body) for a cached-data endpoint.
+    name = path + (" keep" if keep_alive else "")
+    return cached_payload(
+        name, API_PAYLOAD_KINDS[path], lambda: build_api_payload(path, keep_alive)
+    )
+
+
+def build_api_payload(path, keep_alive):
+    if path == "/api/snapshot":
+        body = render_snapshot()
+        extra = "ETag: %s\r\n" % snapshot_etag()
+    elif path == "/api/tubes":
+        body = render_tubes_lines()
+        extra = version_header("tubes")
+    else:
+        kind = API_PAYLOAD_KINDS[path][0]
+        body = cached_line(kind) or ""
+        extra = version_header(kind)
+    data = body.encode("utf-8")
+    head = response_head(200, "text/plain", len(data), extra, keep_alive)
+    return head.encode("utf-8") + data
+
+
+def ws_snapshot_payload(ws):
+    # The full snapshot as ready frames for this client's framing options.
+    name = "ws" + (" batch" if ws.batch else "") + (" deflate" if ws.compress else "")
+    return cached_payload(
+        name, SNAPSHOT_KINDS, lambda: build_ws_snapshot(ws_snapshot_lines(ws), ws)
+    )
+
+
+def build_ws_snapshot(lines, ws):
+    if not lines:
+        return b""
+    if ws.batch:
+        return ws.text_frame("\n".join(lines).encode("utf-8"))
+    return b"".join([ws.text_frame(line.encode("utf-8")) for line in lines])
+
+
 def ws_accept_key(key):
     raw = (key + WS_MAGIC).encode("utf-8")
     digest = uhashlib.sha1(raw).digest()
@@ -474,12 +1216,13 @@ def parse_request_line(line):
     try:
         parts = line.decode().strip().split()
         if len(parts) < 2:
-            return None, None
-        raw_path = parts[1]
-        path = raw_path.split("?", 1)[0].split("#", 1)[0]
-        return parts[0], path
+            return None, None, ""
+        raw_path = parts[1].split("#", 1)[0]
+        pieces = raw_path.split("?", 1)
+        query = pieces[1] if len(pieces) > 1 else ""
+        return parts[0], pieces[0], query
     except Exception:
-        return None, None
+        return None, None, ""
 
 
 async def read_exactly(reader, n):
@@ -497,115 +1240,495 @@ async def read_exactly(reader, n):
     return data
 
 
+async def read_into(reader, mv):
+    # Fill mv completely from the stream without allocating new bytes.
+    got = 0
+    total = len(mv)
+    while got < total:
+        n = await reader.readinto(mv[got:] if got else mv)
+        if n is None:
+            await asyncio.sleep_ms(0)
+            continue
+        if not n:
+            raise OSError("socket closed")
+        got += n
+
+
 class WebSocket:
-    def __init__(self, reader, writer):
+    def __init__(self, reader, writer, batch=False, compress=False):
         self.reader = reader
         self.writer = writer
         self.closed = False
+        self.batch = batch
+        self.compress = compress
+        self.out = deque((), WS_SEND_QUEUE_LIMIT)
+        self.out_event = asyncio.Event()
+        self.pending = {}
+        self.sender = None
+        self.session = None
+        self.close_code = None
+        self.awaiting = set()
+        self.resumable = False
+        self.seq_sent = 0
+        self.topics = None  # None = every topic
+        self.last_rx_ms = time.ticks_ms()
+        self.ping_sent_ms = None
+        # Receive scratch: 2 header + 8 extended length + 4 mask bytes, then
+        # the payload buffer. Views are sliced once here and reused.
+        self.hdr = bytearray(14)
+        hdr = memoryview(self.hdr)
+        self.hdr_base = hdr[0:2]
+        self.hdr_len16 = hdr[2:4]
+        self.hdr_len64 = hdr[2:10]
+        self.hdr_mask = hdr[10:14]
+        self.rx_buf = bytearray(WS_RX_MAX_PAYLOAD)
+        self.rx_mv = memoryview(self.rx_buf)
 
     async def recv(self):
+        hdr = self.hdr
         try:
-            header = await read_exactly(self.reader, 2)
+            await read_into(self.reader, self.hdr_base)
         except Exception as exc:
             if not is_benign_socket_close(exc):
                 log("WS recv header error:", exc)
             return None
 
-        b1 = header[0]
-        b2 = header[1]
+        b1 = hdr[0]
+        b2 = hdr[1]
         fin = (b1 >> 7) & 0x01
+        rsv1 = b1 & 0x40
         opcode = b1 & 0x0F
         masked = b2 & 0x80
         length = b2 & 0x7F
 
         if length == 126:
-            ext = await read_exactly(self.reader, 2)
-            length = (ext[0] << 8) | ext[1]
+            await read_into(self.reader, self.hdr_len16)
+            length = (hdr[2] << 8) | hdr[3]
         elif length == 127:
-            ext = await read_exactly(self.reader, 8)
+            await read_into(self.reader, self.hdr_len64)
             length = 0
-            for b in ext:
-                length = (length << 8) | b
+            for i in range(2, 10):
+                length = (length << 8) | hdr[i]
+        if length > WS_RX_MAX_PAYLOAD:
+            # Checked before reading so a bogus length cannot exhaust RAM.
+            log("WS frame too large:", length)
+            return None
 
-        mask = b""
         if masked:
-            mask = await read_exactly(self.reader, 4)
-
-        payload = await read_exactly(self.reader, length) if length else b""
-        if masked and payload:
-            payload = bytes(payload[i] ^ mask[i % 4] for i in range(len(payload)))
+            await read_into(self.reader, self.hdr_mask)
+        buf = self.rx_buf
+        payload = self.rx_mv[:length]
+        if length:
+            await read_into(self.reader, payload)
+            if masked:
+                unmask(buf, length, self.hdr_mask)
+        # Any complete frame proves the peer is alive.
+        self.last_rx_ms = time.ticks_ms()
+        self.ping_sent_ms = None
 
         if opcode == 8:
-            if len(payload) >= 2:
-                code = (payload[0] << 8) | payload[1]
+            if length >= 2:
+                code = (buf[0] << 8) | buf[1]
                 log("WS close from client, code=", code, "fin=", fin)
             else:
                 log("WS close from client, fin=", fin)
             return None
         if opcode == 9:
-            await self._send_frame(payload, opcode=10)
+            self.enqueue(ws_frame(bytes(payload), opcode=10))
+            return ""
+        if opcode == 10:
             return ""
         if opcode != 1:
-            log("WS non-text frame opcode=", opcode, "len=", len(payload), "fin=", fin)
+            log("WS non-text frame opcode=", opcode, "len=", length, "fin=", fin)
             return ""
+        if rsv1:
+            if not self.compress:
+                log("WS compressed frame without permessage-deflate")
+                return None
+            try:
+                payload = inflate_raw(bytes(payload), WS_INFLATE_LIMIT + 1)
+            except Exception as exc:
+                log("WS inflate error:", exc)
+                return ""
+            if len(payload) > WS_INFLATE_LIMIT:
+                # Never act on a truncated command: close with 1009 (too big).
+                log("WS inflated message too large")
+                self.close_code = 1009
+                return None
 
         try:
-            return payload.decode("utf-8")
+            return str(payload, "utf-8")
         except Exception:
             return ""
 
-    async def _send_frame(self, payload, opcode=1):
+    def start_sender(self):
+        self.session = asyncio.current_task()
+        self.sender = asyncio.create_task(self._sender())
+
+    def enqueue(self, frame, kind=None, payload=None):
+        # Queue a prebuilt frame for this client's sender task; never blocks.
+        # payload is the text body, kept so batching clients can join lines.
         if self.closed:
+            return False
+        if kind in WS_COALESCE_KINDS:
+            entry = self.pending.get(kind)
+            if entry is not None:
+                # A newer state line replaces the stale one still queued.
+                entry[1] = frame
+                entry[2] = payload
+                fanout_stats["coalesced"] += 1
+                return True
+        if len(self.out) >= WS_SEND_QUEUE_LIMIT:
+            fanout_stats["evicted"] += 1
+            log("WS client too slow; disconnecting")
+            self.evict()
+            return False
+        entry = [kind, frame, payload]
+        self.out.append(entry)
+        if kind in WS_COALESCE_KINDS:
+            self.pending[kind] = entry
+        fanout_stats["queued"] += 1
+        self.out_event.set()
+        return True
+
+    def evict(self):
+        self.closed = True
+        self.out_event.set()
+        if self.session is not None:
+            try:
+                self.session.cancel()
+            except Exception:
+                pass
+
+    async def _sender(self):
+        try:
+            while not self.closed:
+                if not self.out:
+                    self.out_event.clear()
+                    await self.out_event.wait()
+                    continue
+                if self.batch:
+                    # Let lines produced in the same burst join one frame.
+                    await asyncio.sleep_ms(WS_BATCH_WINDOW_MS)
+                    self._write_batch(self._seq_entry())
+                else:
+                    while self.out:
+                        self.writer.write(self._pop()[1])
+                    seq_entry = self._seq_entry()
+                    if seq_entry is not None:
+                        self.writer.write(seq_entry[1])
+                await self.writer.drain()
+        except Exception as exc:
+            if not is_benign_socket_close(exc):
+                log("WS send error:", exc)
+            self.evict()
+
+    def _pop(self):
+        entry = self.out.popleft()
+        if self.pending.get(entry[0]) is entry:
+            del self.pending[entry[0]]
+        return entry
+
+    def _seq_entry(self):
+        # With the queue drained, every broadcast up to event_seq has been
+        # written (or superseded), so it is a safe resume point.
+        if not self.resumable or self.seq_sent == event_seq:
+            return None
+        self.seq_sent = event_seq
+        payload = seq_line().encode("utf-8")
+        return [None, ws_frame(payload), payload]
+
+    def _write_batch(self, tail=None):
+        texts = []
+        while self.out:
+            entry = self._pop()
+            if entry[2] is None:
+                # Control frames are never joined; keep them in order.
+                self._write_joined(texts)
+                texts = []
+                self.writer.write(entry[1])
+            else:
+                texts.append(entry)
+        if tail is not None:
+            texts.append(tail)
+        self._write_joined(texts)
+
+    def _write_joined(self, entries):
+        if not entries:
             return
-        header = bytearray()
-        header.append(0x80 | (opcode & 0x0F))
-        length = len(payload)
-        if length < 126:
-            header.append(length)
-        elif length < 65536:
-            header.append(126)
-            header.extend(bytearray([(length >> 8) & 0xFF, length & 0xFF]))
-        else:
-            header.append(127)
-            for shift in (56, 48, 40, 32, 24, 16, 8, 0):
-                header.append((length >> shift) & 0xFF)
+        if len(entries) == 1:
+            self.writer.write(entries[0][1])
+            return
+        frame = self.text_frame(b"\n".join([e[2] for e in entries]))
+        self.writer.write(frame)
+        fanout_stats["batch_frames_saved"] += len(entries) - 1
+        fanout_stats["batch_bytes_saved"] += sum([len(e[1]) for e in entries]) - len(frame)
 
+    async def _write_frame(self, frame):
+        if self.closed:
+            return
         try:
-            self.writer.write(header)
-            if payload:
-                self.writer.write(payload)
+            self.writer.write(frame)
             await self.writer.drain()
         except Exception:
             self.closed = True
 
+    def wants(self, kind):
+        return self.topics is None or WS_TOPICS.get(kind, "other") in self.topics
+
+    def text_frame(self, payload):
+        if self.compress:
+            return ws_deflate_frame(payload)
+        return ws_frame(payload)
+
     async def send_text(self, text):
-        await self._send_frame(text.encode("utf-8"), opcode=1)
+        # Direct write; only used before the sender task starts.
+        await self._write_frame(self.text_frame(text.encode("utf-8")))
+
+    async def send_frames(self, frames):
+        # Already-framed bytes, e.g. the shared snapshot; same rule as above.
+        await self._write_frame(frames)
 
     async def close(self):
-        if self.closed:
-            return
-        self.closed = True
-        try:
-            await self._send_frame(b"", opcode=8)
-        except Exception:
-            pass
+        if self.sender is not None:
+            self.sender.cancel()
+            self.sender = None
+        if not self.closed:
+            self.closed = True
+            body = b""
+            if self.close_code is not None:
+                body = bytes((self.close_code >> 8, self.close_code & 0xFF))
+            try:
+                self.writer.write(ws_frame(body, opcode=8))
+                await self.writer.drain()
+            except Exception:
+                pass
         try:
             await self.writer.wait_closed()
         except Exception:
             pass
 
 
-async def broadcast(line):
-    if not clients:
+def ws_frame(payload, opcode=1, rsv1=False):
+    # Build a complete unmasked server frame once so it can be shared.
+    b1 = 0x80 | (opcode & 0x0F)
+    if rsv1:
+        b1 |= 0x40
+    return ws_header(b1, len(payload)) + payload
+
+
+def deflate_raw(data):
+    # One self-contained permessage-deflate message (no context takeover).
+    if deflate is not None:
+        buf = io.BytesIO()
+        with deflate.DeflateIO(buf, deflate.RAW, WS_DEFLATE_WBITS) as f:
+            f.write(data)
+        # Ends in a BFINAL block; RFC 7692 7.2.3.3 permits this with the
+        # empty-block tail reduced to one zero byte.
+        return buf.getvalue() + b"\x00"
+    c = zlib.compressobj(6, zlib.DEFLATED, -WS_DEFLATE_WBITS)
+    return (c.compress(data) + c.flush(zlib.Z_SYNC_FLUSH))[:-4]
+
+
+def inflate_raw(data, limit):
+    # Restore the stripped sync-flush tail, then close with an empty final
+    # block so the decoder sees a complete stream.
+    data = data + b"\x00\x00\xff\xff\x03\x00"
+    if deflate is not None:
+        with deflate.DeflateIO(io.BytesIO(data), deflate.RAW, WS_DEFLATE_WBITS) as f:
+            return f.read(limit)
+    return zlib.decompressobj(-15).decompress(data, limit)
+
+
+def deflate_available():
+    if not WS_DEFLATE or (deflate is None and zlib is None):
+        return False
+    try:
+        # Many MicroPython ports ship the deflate module decompress-only.
+        deflate_raw(b"probe")
+        return True
+    except Exception:
+        return False
+
+
+WS_DEFLATE_AVAILABLE = deflate_available()
+
+
+def ws_deflate_frame(payload):
+    # Compressed text frame, or a plain one when compression does not pay.
+    if len(payload) < WS_DEFLATE_MIN_BYTES:
+        deflate_stats["skipped"] += 1
+        return ws_frame(payload)
+    t0 = time.ticks_us()
+    packed = deflate_raw(payload)
+    deflate_stats["us_total"] += time.ticks_diff(time.ticks_us(), t0)
+    if len(packed) >= len(payload):
+        deflate_stats["skipped"] += 1
+        return ws_frame(payload)
+    deflate_stats["messages"] += 1
+    deflate_stats["bytes_in"] += len(payload)
+    deflate_stats["bytes_out"] += len(packed)
+    return ws_frame(packed, rsv1=True)
+
+
+def ws_deflate_response(offers):
+    # Sec-WebSocket-Extensions response value, or None to decline.
+    if not WS_DEFLATE_AVAILABLE:
+        return None
+    for offer in offers.split(","):
+        parts = offer.split(";")
+        if parts[0].strip() != "permessage-deflate":
+            continue
+        params = {}
+        for part in parts[1:]:
+            kv = part.strip().split("=", 1)
+            params[kv[0].strip()] = kv[1].strip().strip('"') if len(kv) > 1 else ""
+        # Only accept when the client's window can be bounded for inflate.
+        if "client_max_window_bits" not in params:
+            continue
+        try:
+            client_bits = int(params["client_max_window_bits"] or "15")
+            server_bits = int(params.get("server_max_window_bits") or "15")
+        except ValueError:
+            continue
+        if server_bits < WS_DEFLATE_WBITS:
+            continue
+        resp = "permessage-deflate; server_no_context_takeover; client_no_context_takeover"
+        if "server_max_window_bits" in params:
+            resp += "; server_max_window_bits=%d" % WS_DEFLATE_WBITS
+        resp += "; client_max_window_bits=%d" % min(client_bits, WS_DEFLATE_WBITS)
+        return resp
+    return None
+
+
+def seq_line():
+    return "SEQ %d %s" % (event_seq, boot_id)
+
+
+def record_event(kind, payload):
+    global event_seq, event_wake
+    event_seq += 1
+    event_ring[event_seq % WS_EVENT_RING_SIZE] = [event_seq, kind, payload]
+    if event_wake is not None:
+        event_wake.set()
+        event_wake = None
+
+
+def events_since(since):
+    # Ring entries after `since`, or None if some have been overwritten.
+    if since > event_seq:
+        return None
+    if event_seq - since > WS_EVENT_RING_SIZE:
+        return None
+    out = []
+    for seq in range(since + 1, event_seq + 1):
+        entry = event_ring[seq % WS_EVENT_RING_SIZE]
+        if entry is None or entry[0] != seq:
+            return None
+        out.append(entry)
+    return out
+
+
+def broadcast(line, kind="other"):
+    # Encode once, then hand the frame to each client's sender task.
+    payload = line.encode("utf-8")
+    record_event(kind, payload)
+    if not clients and not streams:
         return
+    frame = None
+    zframe = None
     dead = []
     for ws in clients:
-        try:
-            await ws.send_text(line)
-        except Exception:
+        if kind in ws.awaiting:
+            # Explicitly requested, so delivered regardless of topics.
+            ws.awaiting.discard(kind)
+        elif not ws.wants(kind):
+            fanout_stats["filtered"] += 1
+            continue
+        if frame is None:
+            frame = ws_frame(payload)
+            fanout_stats["frames"] += 1
+        out = frame
+        if ws.compress:
+            if zframe is None:
+                # Messages are context-free, so one compressed frame serves all.
+                zframe = ws_deflate_frame(payload)
+            out = zframe
+        if not ws.enqueue(out, kind, payload):
             dead.append(ws)
     for ws in dead:
         clients.discard(ws)
+    if streams:
+        broadcast_streams(kind, payload)
+
+
+def broadcast_streams(kind, payload):
+    # Same line for SSE clients, also built once and shared.
+    event = None
+    for stream in list(streams):
+        if not stream.wants(kind):
+            continue
+        if event is None:
+            event = sse_event(event_seq, payload)
+        if not stream.enqueue(event):
+            streams.discard(stream)
+
+
+def answer_waiters(kind, line):
+    frame = None
+    for ws in clients:
+        if kind in ws.awaiting:
+            ws.awaiting.discard(kind)
+            if frame is None:
+                payload = line.encode("utf-8")
+                frame = ws_frame(payload)
+            ws.enqueue(ws.text_frame(payload) if ws.compress else frame, kind, payload)
+
+
+async def ws_keepalive_task():
+    # Ping clients that have gone quiet and reap the ones that never answer.
+    interval_ms = WS_PING_INTERVAL_S * 1000
+    timeout_ms = WS_PONG_TIMEOUT_S * 1000
+    ping = ws_frame(b"", opcode=9)
+    while True:
+        await asyncio.sleep_ms(max(1000, interval_ms // 5))
+        now = time.ticks_ms()
+        for ws in list(clients):
+            if ws.ping_sent_ms is not None:
+                if time.ticks_diff(now, ws.ping_sent_ms) > timeout_ms:
+                    keepalive_stats["reaped"] += 1
+                    log("WS client unresponsive; reaping")
+                    clients.discard(ws)
+                    ws.evict()
+            elif time.ticks_diff(now, ws.last_rx_ms) >= interval_ms:
+                ws.ping_sent_ms = now
+                keepalive_stats["pings"] += 1
+                ws.enqueue(ping)
+
+
+def uart_flow_snapshot():
+    stats = dict(uart_flow_stats)
+    stats["credits"] = UART_TX_CREDITS
+    stats["inflight"] = len(uart_tx_inflight)
+    return stats
+
+
+def collect_stats():
+    return {
+        "clients": len(clients),
+        "keepalive": keepalive_stats,
+        "http": http_stats,
+        "uart_tx": uart_tx.stats(),
+        "uart_flow": uart_flow_snapshot(),
+        "fanout": fanout_stats,
+        "versions": state_versions,
+        "deflate": deflate_stats,
+        "get_cache": get_cache_stats,
+        "tubes": tube_stats,
+        "payloads": payload_stats,
+        "sse": sse_snapshot(),
+        "assets": asset_cache_snapshot(),
+    }
 
 
 def normalize_client_command(line):
@@ -633,7 +1756,7 @@ def normalize_client_command(line):
 
 
 def handle_uart_line(line):
-    global last_state_line, last_labels_line, last_amp_states_line, tubes_end_seen
+    global last_state_line, last_labels_line, last_amp_states_line
 
     def strip_embedded_tubes_end(raw):
         if "END TUBES" in raw:
@@ -642,14 +1765,24 @@ def handle_uart_line(line):
             return raw.replace("TUBES_END", "").strip(), True
         return raw, False
 
+    # Unchanged cached lines return no output so they are not rebroadcast.
     if line.startswith("STATE "):
+        if line == last_state_line:
+            return "state", []
         last_state_line = line
+        state_versions["state"] += 1
         return "state", [line]
     if line.startswith("SELECTOR_LABELS"):
+        if line == last_labels_line:
+            return "labels", []
         last_labels_line = line
+        state_versions["labels"] += 1
         return "labels", [line]
     if line.startswith("AMP_STATES"):
+        if line == last_amp_states_line:
+            return "amp_states", []
         last_amp_states_line = line
+        state_versions["amp_states"] += 1
         return "amp_states", [line]
     if line.startswith("TUBE "):
         clean_line, saw_end = strip_embedded_tubes_end(line)
@@ -657,120 +1790,233 @@ def handle_uart_line(line):
         is_valid = has_valid_tube_metrics(clean_line)
         out = []
         if num is not None and clean_line and is_valid:
-            tube_lines[num] = clean_line
+            staging = active_tube_staging()
+            if staging is not None:
+                staging[num] = clean_line
+            elif tube_lines.get(num) != clean_line:
+                # Unsolicited update (e.g. after SET TUBE) applies directly.
+                tube_lines[num] = clean_line
+                state_versions["tubes"] += 1
             out.append(clean_line)
         if saw_end:
-            tubes_end_seen = True
+            finish_tubes_generation()
             out.append("END TUBES")
         return "tube", out
     clean_line, saw_end = strip_embedded_tubes_end(line)
     if clean_line == "TUBES_END" or clean_line == "END TUBES" or saw_end:
-        tubes_end_seen = True
+        finish_tubes_generation()
         return "tubes_end", ["END TUBES"]
     return "other", [line]
 
 
-def _next_uart_marker_index(text, start):
-    markers = (
-        "STATE ",
-        "SELECTOR_LABELS",
-        "AMP_STATES",
-        "TUBE ",
-        "ACK ",
-        "DONE SAVE",
-        "ERR ",
-        "END TUBES",
-        "TUBES_END",
-    )
-    found = -1
+UART_MARKERS = (
+    b"STATE ",
+    b"SELECTOR_LABELS",
+    b"AMP_STATES",
+    b"TUBE ",
+    b"ACK ",
+    b"DONE SAVE",
+    b"ERR ",
+    b"END TUBES",
+    b"TUBES_END",
+)
+
+
+def _build_marker_table(markers):
+    # First byte -> candidate markers, so each position costs one dict lookup.
+    table = {}
     for marker in markers:
-        idx = text.find(marker, start)
-        if idx >= 0 and (found < 0 or idx < found):
-            found = idx
-    return found
+        table.setdefault(marker[0], []).append(marker)
+    for key in table:
+        table[key] = tuple(table[key])
+    return table
 
 
-def extract_uart_frames(buffer, flush_incomplete=False):
-    frames = []
-    text = buffer.replace("\r", "\n")
+UART_MARKERS_BY_BYTE = _build_marker_table(UART_MARKERS)
 
-    while True:
-        text = text.lstrip("\n\t ")
-        if not text:
-            return frames, ""
-
-        first = _next_uart_marker_index(text, 0)
-        if first < 0:
-            if flush_incomplete:
-                line = text.strip()
-                if line:
-                    frames.append(line)
-                return frames, ""
-            return frames, text
-        if first > 0:
-            text = text[first:]
-
-        next_marker = _next_uart_marker_index(text, 1)
-        newline = text.find("\n", 1)
-        cut = -1
-        use_newline = False
-        if newline >= 0 and (next_marker < 0 or newline < next_marker):
-            cut = newline
-            use_newline = True
-        elif next_marker >= 0:
-            cut = next_marker
-
-        if cut < 0:
-            if flush_incomplete:
-                line = text.strip()
-                if line:
-                    frames.append(line)
-                return frames, ""
-            return frames, text
-
-        line = text[:cut].strip()
-        if line:
-            frames.append(line)
-        if use_newline:
-            text = text[cut + 1:]
+
+class UartFrameParser:
+    # Streaming splitter for preamp output. Bytes are read straight into a
+    # preallocated buffer and scanned once; a frame ends at CR/LF or where
+    # the next marker begins. Only completed frames are decoded, so UTF-8
+    # sequences split across reads survive intact.
+
+    def __init__(self, size):
+        self.size = size
+        self.buf = bytearray(size)
+        self.mv = memoryview(self.buf)
+        self.head = 0    # first retained byte (frame start or stray text)
+        self.start = -1  # start of current frame, -1 between frames
+        self.pos = 0     # resume point for the next scan
+        self.end = 0     # bytes held
+        self.overflows = 0
+
+    def pending(self):
+        return self.end > self.head
+
+    def write_view(self):
+        return self.mv[self.end :]
+
+    def advance(self, n):
+        self.end += n
+
+    def _match_marker(self, i):
+        return match_marker(
+            self.buf, i, self.end, UART_MARKERS_BY_BYTE.get(self.buf[i])
+        )
+
+    def _emit(self, frames, a, b):
+        buf = self.buf
+        while a < b and buf[a] in (9, 10, 13, 32):
+            a += 1
+        while b > a and buf[b - 1] in (9, 10, 13, 32):
+            b -= 1
+        if a >= b:
+            return
+        raw = bytes(self.mv[a:b])
+        try:
+            frames.append(raw.decode("utf-8"))
+        except Exception:
+            frames.append(raw.decode("utf-8", "ignore"))
+
+    def frames(self, flush_incomplete=False):
+        frames = []
+        buf = self.buf
+        end = self.end
+        i = self.pos
+        while i < end:
+            b = buf[i]
+            if self.start < 0:
+                found = self._match_marker(i)
+                if found < 0:
+                    break
+                if found:
+                    # Stray text before a marker is dropped.
+                    self.start = i
+                    self.head = i
+                i += 1
+                continue
+            if b == 10 or b == 13:
+                self._emit(frames, self.start, i)
+                self.start = -1
+                self.head = i + 1
+                i += 1
+                continue
+            if i > self.start:
+                found = self._match_marker(i)
+                if found < 0:
+                    break
+                if found:
+                    self._emit(frames, self.start, i)
+                    self.start = i
+                    self.head = i
+            i += 1
+        self.pos = i
+
+        if self.head == 0 and end >= self.size and not flush_incomplete:
+            # A single frame filled the buffer; cut it rather than drop it.
+            self.overflows += 1
+            log("UART rx overflow; forced frame cut at", end, "bytes")
+            flush_incomplete = True
+        if flush_incomplete:
+            self._emit(frames, self.head, end)
+            self.head = self.pos = self.end = 0
+            self.start = -1
+            return frames
+
+        head = self.head
+        if head:
+            keep = end - head
+            if keep:
+                self.mv[0:keep] = self.mv[head:end]
+            self.end = keep
+            self.pos -= head
+            if self.start >= 0:
+                self.start -= head
+            self.head = 0
+        return frames
+
+
+def dispatch_uart_frames(frames):
+    for line in frames:
+        kind, out_lines = handle_uart_line(line)
+        reply = line
+        if kind == "tubes_end" or (kind == "tube" and out_lines and out_lines[-1] == "END TUBES"):
+            # END TUBES may ride on the last TUBE line; either way the reply is over.
+            reply = "END TUBES"
+            note_get_reply("tubes_end")
         else:
-            text = text[cut:]
+            note_get_reply(kind)
+        done = uart_tx_match_reply(reply)
+        answer_command_waiters(reply, done)
+        log("UART <-", line)
+        if not out_lines and kind in WS_COALESCE_KINDS:
+            # Unchanged: only clients that asked for it get the line.
+            fanout_stats["suppressed"] += 1
+            answer_waiters(kind, line)
+            continue
+        if UART_TX_CREDITS and kind == "other" and line.startswith("ERR") and done is not None:
+            origin = done[3]
+            if origin is not None and origin in clients:
+                # Report failures to the client that sent the command.
+                payload = line.encode("utf-8")
+                origin.enqueue(origin.text_frame(payload), kind, payload)
+                continue
+        for out_line in out_lines:
+            broadcast(out_line, kind)
 
 
-async def uart_reader_task(uart):
-    global uart_rx_buffer, uart_last_rx_ms
+async def uart_poll_rx_loop(uart, parser):
+    global uart_last_rx_ms
+    idle_flush_ms = max(UART_RX_IDLE_FLUSH_MS, UART_POLL_MS * 3)
     while True:
         if uart.any():
-            raw = uart.read()
-            if raw:
-                if isinstance(raw, str):
-                    raw = raw.encode("utf-8")
-                try:
-                    uart_rx_buffer += bytes(raw).decode("utf-8")
-                except Exception:
-                    uart_rx_buffer += bytes(raw).decode("utf-8", "ignore")
+            n = uart.readinto(parser.write_view())
+            if n:
+                parser.advance(n)
                 uart_last_rx_ms = time.ticks_ms()
-                frames, uart_rx_buffer = extract_uart_frames(uart_rx_buffer, False)
-                for line in frames:
-                    kind, out_lines = handle_uart_line(line)
-                    log("UART <-", line)
-                    for out_line in out_lines:
-                        await broadcast(out_line)
-
-                if len(uart_rx_buffer) > 1024:
-                    uart_rx_buffer = uart_rx_buffer[-256:]
-        elif uart_rx_buffer:
+                dispatch_uart_frames(parser.frames(False))
+        elif parser.pending():
             idle_ms = time.ticks_diff(time.ticks_ms(), uart_last_rx_ms)
-            if idle_ms > max(50, UART_POLL_MS * 3):
-                frames, uart_rx_buffer = extract_uart_frames(uart_rx_buffer, True)
-                for line in frames:
-                    kind, out_lines = handle_uart_line(line)
-                    log("UART <-", line)
-                    for out_line in out_lines:
-                        await broadcast(out_line)
+            if idle_ms > idle_flush_ms:
+                dispatch_uart_frames(parser.frames(True))
         await asyncio.sleep_ms(UART_POLL_MS)
 
 
+async def uart_stream_rx_loop(reader, parser):
+    global uart_last_rx_ms
+    while True:
+        view = parser.write_view()
+        if parser.pending():
+            # Partial frame held: wait at most the inter-byte idle timeout.
+            try:
+                n = await asyncio.wait_for_ms(reader.readinto(view), UART_RX_IDLE_FLUSH_MS)
+            except asyncio.TimeoutError:
+                dispatch_uart_frames(parser.frames(True))
+                continue
+        else:
+            n = await reader.readinto(view)
+        if n:
+            parser.advance(n)
+            uart_last_rx_ms = time.ticks_ms()
+            dispatch_uart_frames(parser.frames(False))
+
+
+async def uart_reader_task(uart, mode=UART_RX_MODE):
+    parser = UartFrameParser(UART_RX_BUFFER_SIZE)
+    if mode == "stream":
+        try:
+            reader = asyncio.StreamReader(uart)
+        except Exception as exc:
+            log("UART stream reader unavailable, polling instead:", exc)
+        else:
+            log("UART rx mode: stream")
+            await uart_stream_rx_loop(reader, parser)
+            return
+    log("UART rx mode: poll every", UART_POLL_MS, "ms")
+    await uart_poll_rx_loop(uart, parser)
+
+
 async def uart_startup_sync(uart):
     await asyncio.sleep_ms(UART_STARTUP_SYNC_DELAY_MS)
     uart_send(uart, "GET STATE")
@@ -779,35 +2025,132 @@ async def uart_startup_sync(uart):
     uart_send(uart, "GET TUBES")
 
 
-async def ws_session(ws, uart):
+def parse_topics(text):
+    # "state,labels" -> {"state", "labels"}; "*", "all" or empty -> None.
+    # Only unknown names -> an empty set, which callers ignore so a typo
+    # never widens the subscription.
+    topics = set()
+    named = False
+    for name in text.replace(" ", ",").split(","):
+        name = name.strip().lower()
+        if not name:
+            continue
+        if name in ("*", "all"):
+            return None
+        named = True
+        if name in WS_TOPICS.values():
+            topics.add(name)
+    if not named:
+        return None
+    return topics
+
+
+def ws_snapshot_lines(ws):
+    snapshot = []
+    if last_labels_line and ws.wants("labels"):
+        snapshot.append(last_labels_line)
+    if last_state_line and ws.wants("state"):
+        snapshot.append(last_state_line)
+    if last_amp_states_line and ws.wants("amp_states"):
+        snapshot.append(last_amp_states_line)
+    tubes_text = render_tubes_lines() if ws.wants("tube") else ""
+    if tubes_text:
+        for line in tubes_text.split("\n"):
+            if line:
+                snapshot.append(line)
+    return snapshot
+
+
+def ws_resume_lines(ws, params):
+    # Missed lines for a client resuming with ?since=<seq>&boot=<id>, or
+    # None when it needs a full snapshot.
+    if params.get("boot") != boot_id:
+        return None
+    try:
+        since = int(params.get("since", "0"))
+    except ValueError:
+        return None
+    if since <= 0:
+        return None
+    entries = events_since(since)
+    if entries is None:
+        fanout_stats["resume_misses"] += 1
+        return None
+    fanout_stats["resumed"] += 1
+    return [e[2].decode("utf-8") for e in entries if ws.wants(e[1])]
+
+
+async def ws_session(ws, uart, query=""):
     clients.add(ws)
     log("WS client connected; clients=", len(clients))
     try:
-        if last_labels_line:
-            await ws.send_text(last_labels_line)
-        if last_state_line:
-            await ws.send_text(last_state_line)
-        if last_amp_states_line:
-            await ws.send_text(last_amp_states_line)
-        tubes_text = render_tubes_lines()
-        if tubes_text:
-            for line in tubes_text.split("\n"):
-                if line:
-                    await ws.send_text(line)
+        params = parse_query(query)
+        if "sub" in params:
+            topics = parse_topics(params["sub"])
+            if topics is None or topics:
+                ws.topics = topics
+        snapshot = None
+        if "since" in params:
+            ws.resumable = True
+            snapshot = ws_resume_lines(ws, params)
+        prebuilt = None
+        if snapshot is not None:
+            log("WS resume: replaying", len(snapshot), "lines")
+        elif ws.topics is None:
+            # Shared pre-framed snapshot, sent in one write.
+            prebuilt = ws_snapshot_payload(ws)
+            snapshot = []
+        else:
+            snapshot = ws_snapshot_lines(ws)
+        if ws.resumable:
+            snapshot.append(seq_line())
+            ws.seq_sent = event_seq
+        if prebuilt:
+            await ws.send_frames(prebuilt)
+        if ws.batch and snapshot:
+            await ws.send_text("\n".join(snapshot))
+        else:
+            for line in snapshot:
+                await ws.send_text(line)
+        ws.start_sender()
 
         while True:
             msg = await ws.recv()
-            if msg is None:
+            if msg is None or ws.closed:
                 break
             msg = msg.strip()
             if not msg:
                 continue
+            if msg.upper().startswith("SUB "):
+                topics = parse_topics(msg[4:])
+                if topics is not None and not topics:
+                    # Keep the current subscription and tell the client why.
+                    payload = b"ERR SUB unknown topic"
+                    ws.enqueue(ws.text_frame(payload), "other", payload)
+                    continue
+                ws.topics = topics
+                log("WS topics:", ws.topics or "all")
+                continue
 
             cmd = normalize_client_command(msg)
+            if not cmd and msg.upper().startswith("GET "):
+                cmd = msg
             if cmd:
-                uart_send(uart, cmd)
-            elif msg.upper().startswith("GET "):
-                uart_send(uart, msg)
+                kind = GET_REPLY_KINDS.get(cmd.upper())
+                if kind:
+                    line = cached_get_reply(kind)
+                    if line is not None:
+                        # Fresh enough: answer this client alone from the cache.
+                        payload = line.encode("utf-8")
+                        ws.enqueue(ws.text_frame(payload), kind, payload)
+                        continue
+                    # Reply even if the value turns out to be unchanged.
+                    ws.awaiting.add(kind)
+                elif cmd.upper().startswith("SET "):
+                    # A clamped or refused SET leaves STATE unchanged; the
+                    # sender still needs it to undo its optimistic update.
+                    ws.awaiting.add("state")
+                uart_send(uart, cmd, ws)
     except Exception as exc:
         log("WS session error:", exc)
     finally:
@@ -816,34 +2159,169 @@ async def ws_session(ws, uart):
         await ws.close()
 
 
+class EventStream:
+    # A text/event-stream client. broadcast() queues ready-made events here and
+    # run() writes them out, with a comment line whenever the stream is idle.
+    def __init__(self, writer):
+        self.writer = writer
+        self.out = deque((), WS_SEND_QUEUE_LIMIT)
+        self.out_event = asyncio.Event()
+        self.topics = None  # None = every topic
+        self.closed = False
+
+    def wants(self, kind):
+        return self.topics is None or WS_TOPICS.get(kind, "other") in self.topics
+
+    def enqueue(self, event):
+        if self.closed:
+            return False
+        if len(self.out) >= WS_SEND_QUEUE_LIMIT:
+            sse_stats["evicted"] += 1
+            log("SSE client too slow; disconnecting")
+            self.closed = True
+            self.out_event.set()
+            return False
+        self.out.append(event)
+        self.out_event.set()
+        return True
+
+    async def run(self):
+        heartbeat_ms = SSE_HEARTBEAT_S * 1000
+        try:
+            while not self.closed:
+                if not self.out:
+                    self.out_event.clear()
+                    try:
+                        await asyncio.wait_for_ms(self.out_event.wait(), heartbeat_ms)
+                    except asyncio.TimeoutError:
+                        # Also how a vanished client is noticed.
+                        self.writer.write(b": ping\n\n")
+                        await self.writer.drain()
+                    continue
+                while self.out:
+                    self.writer.write(self.out.popleft())
+                await self.writer.drain()
+        except Exception as exc:
+            if not is_benign_socket_close(exc):
+                log("SSE send error:", exc)
+        finally:
+            self.closed = True
+
+
+def sse_snapshot():
+    stats = dict(sse_stats)
+    stats["streams"] = len(streams)
+    return stats
+
+
+def sse_event(seq, payload):
+    # The id carries the boot id so a resume across a bridge reboot is detected.
+    return ("id: %s-%d\ndata: " % (boot_id, seq)).encode("utf-8") + payload + b"\n\n"
+
+
+def sse_replay(stream, last_id):
+    # Events a client resuming with Last-Event-ID missed, or None for a snapshot.
+    parts = last_id.split("-")
+    if len(parts) != 2 or parts[0] != boot_id:
+        return None
+    try:
+        since = int(parts[1])
+    except ValueError:
+        return None
+    entries = events_since(since)
+    if entries is None:
+        return None
+    return [sse_event(e[0], e[2]) for e in entries if stream.wants(e[1])]
+
+
+async def sse_session(writer, query, last_id):
+    stream = EventStream(writer)
+    params = parse_query(query)
+    if "sub" in params:
+        topics = parse_topics(params["sub"])
+        if topics is None or topics:
+            stream.topics = topics
+    events = sse_replay(stream, last_id) if last_id else None
+    if events is not None:
+        sse_stats["resumed"] += 1
+    else:
+        events = []
+        for line in ws_snapshot_lines(stream):
+            events.append(sse_event(event_seq, line.encode("utf-8")))
+    # Written and registered without yielding, so no broadcast falls in between.
+    streams.add(stream)
+    sse_stats["opened"] += 1
+    log("SSE client connected; streams=", len(streams))
+    try:
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Cache-Control: no-store\r\n"
+            b"Connection: close\r\n\r\n"
+            b"retry: 2000\n\n"
+        )
+        for event in events:
+            writer.write(event)
+        await writer.drain()
+        await stream.run()
+    except Exception as exc:
+        if not is_benign_socket_close(exc):
+            log("SSE error:", exc)
+    finally:
+        stream.closed = True
+        streams.discard(stream)
+        log("SSE client disconnected; streams=", len(streams))
+
+
 async def handle_http(reader, writer, uart):
+    # Serve requests on one connection until the client or a limit ends it.
+    http_stats["connections"] += 1
+    served = 0
+    try:
+        while True:
+            if served:
+                http_stats["reused"] += 1
+            served += 1
+            last = served >= HTTP_KEEPALIVE_MAX_REQUESTS
+            if not await handle_http_request(reader, writer, uart, served > 1, last):
+                break
+    finally:
+        await close_writer(writer)
+
+
+def wants_keep_alive(request_line, headers):
+    # HTTP/1.1 defaults to persistent connections; HTTP/1.0 must ask.
+    connection = headers.get("connection", "").lower()
+    if "close" in connection:
+        return False
+    if request_line.rstrip().endswith(b"HTTP/1.0"):
+        return "keep-alive" in connection
+    return True
+
+
+async def handle_http_request(reader, writer, uart, idle_wait, last):
+    # Returns True when the connection can carry another request.
     try:
-        request_line = await reader.readline()
+        if idle_wait:
+            try:
+                request_line = await asyncio.wait_for_ms(
+                    reader.readline(), HTTP_KEEPALIVE_IDLE_MS
+                )
+            except asyncio.TimeoutError:
+                http_stats["idle_closed"] += 1
+                return False
+        else:
+            request_line = await reader.readline()
     except OSError as exc:
         # Mobile browsers may reset sockets while backgrounding/resuming.
         if not exc.args or exc.args[0] != 104:
             log("HTTP read request line error:", exc)
-        try:
-            writer.close()
-        except Exception:
-            pass
-        try:
-            await writer.wait_closed()
-        except Exception:
-            pass
-        return
+        return False
     if not request_line:
-        try:
-            writer.close()
-        except Exception:
-            pass
-        try:
-            await writer.wait_closed()
-        except Exception:
-            pass
-        return
+        return False
 
-    method, path = parse_request_line(request_line)
+    http_stats["requests"] += 1
+    method, path, query = parse_request_line(request_line)
     log("HTTP", method, path)
     headers = {}
     while True:
@@ -852,15 +2330,7 @@ async def handle_http(reader, writer, uart):
         except OSError as exc:
             if not exc.args or exc.args[0] != 104:
                 log("HTTP read header error:", exc)
-            try:
-                writer.close()
-            except Exception:
-                pass
-            try:
-                await writer.wait_closed()
-            except Exception:
-                pass
-            return
+            return False
         if not line or line in (b"\r\n", b"\n"):
             break
         try:
@@ -868,74 +2338,111 @@ async def handle_http(reader, writer, uart):
             headers[key.strip().lower()] = value.strip()
         except Exception:
             continue
+    keep = not last and wants_keep_alive(request_line, headers)
 
     if headers.get("upgrade", "").lower() == "websocket":
         if is_setup_mode_active():
-            await send_response(writer, 403, "text/plain", "Setup mode")
-            return
+            await send_response(writer, 403, "text/plain", "Setup mode", keep_alive=keep)
+            return keep
         key = headers.get("sec-websocket-key")
         if not key:
             log("WS upgrade missing key")
-            try:
-                writer.close()
-            except Exception:
-                pass
-            try:
-                await writer.wait_closed()
-            except Exception:
-                pass
-            return
+            return False
         accept = ws_accept_key(key)
-        log("WS upgrade accepted for", path)
+        protocols = [p.strip() for p in headers.get("sec-websocket-protocol", "").split(",")]
+        batch = WS_BATCH_PROTOCOL in protocols
+        log("WS upgrade accepted for", path, "batch=", batch)
         resp = (
             "HTTP/1.1 101 Switching Protocols\r\n"
             "Upgrade: websocket\r\n"
             "Connection: Upgrade\r\n"
-            "Sec-WebSocket-Accept: %s\r\n\r\n"
+            "Sec-WebSocket-Accept: %s\r\n"
         ) % accept
+        if batch:
+            resp += "Sec-WebSocket-Protocol: %s\r\n" % WS_BATCH_PROTOCOL
+        extensions = ws_deflate_response(headers.get("sec-websocket-extensions", ""))
+        if extensions:
+            resp += "Sec-WebSocket-Extensions: %s\r\n" % extensions
+        resp += "\r\n"
         writer.write(resp.encode("utf-8"))
         await writer.drain()
-        ws = WebSocket(reader, writer)
-        await ws_session(ws, uart)
-        return
+        ws = WebSocket(reader, writer, batch, extensions is not None)
+        await ws_session(ws, uart, query)
+        return False
 
-    if method == "POST" and path == "/save":
+    # Consume any body up front so the next request starts at a clean boundary.
+    try:
         length = int(headers.get("content-length", "0") or "0")
-        body = b""
-        if length:
+    except ValueError:
+        length = 0
+    body = b""
+    if length:
+        try:
             body = await read_exactly(reader, length)
+        except OSError:
+            return False
+
+    if method == "POST" and path == "/save":
         data = parse_form(body)
         ssid = data.get("ssid", "")
         password = data.get("password", "")
         if ssid:
             save_wifi_config(ssid, password)
-            await send_response(writer, 200, "text/html", AP_PAGE.replace("__SSID__", ssid))
+            await send_response(
+                writer, 200, "text/html", AP_PAGE.replace("__SSID__", ssid), keep_alive=keep
+            )
             start_sta_task({"ssid": ssid, "password": password})
-            return
-        await send_response(writer, 400, "text/plain", "Missing SSID")
-        return
+            return keep
+        await send_response(writer, 400, "text/plain", "Missing SSID", keep_alive=keep)
+        return keep
     if method == "POST" and path == "/api/cmd":
-        length = int(headers.get("content-length", "0") or "0")
-        body = b""
-        if length:
-            body = await read_exactly(reader, length)
+        # One command per line; the whole batch is rejected if any is invalid.
         try:
-            line = body.decode("utf-8").strip()
+            text = body.decode("utf-8")
         except Exception:
-            line = ""
-        cmd = normalize_client_command(line)
-        if cmd:
+            text = ""
+        cmds = []
+        for line in text.split("\n"):
+            if not line.strip():
+                continue
+            cmd = normalize_client_command(line)
+            if not cmd:
+                cmds = None
+                break
+            cmds.append(cmd)
+        if not cmds or len(cmds) > UART_TX_QUEUE_LIMIT:
+            await send_response(writer, 400, "text/plain", "BAD_CMD", keep_alive=keep)
+            return keep
+        if len(cmds) > 1:
+            http_stats["cmd_batches"] += 1
+        if "wait" in parse_query(query):
+            results = await run_commands_waiting(uart, cmds)
+            await send_response(
+                writer, 200, "application/json", json.dumps(results), keep_alive=keep
+            )
+            return keep
+        pending = []
+        for cmd in cmds:
+            kind = GET_REPLY_KINDS.get(cmd.upper())
+            if kind and cached_get_reply(kind) is not None:
+                continue
+            pending.append(cmd)
+        # All or nothing: QUEUE_FULL means none of the batch was queued.
+        if not uart_tx.fits([cmd.upper() for cmd in pending]):
+            await send_response(writer, 503, "text/plain", "QUEUE_FULL", keep_alive=keep)
+            return keep
+        for cmd in pending:
             uart_send(uart, cmd)
-            await send_response(writer, 200, "text/plain", "OK")
-            return
-        await send_response(writer, 400, "text/plain", "BAD_CMD")
-        return
+        await send_response(writer, 200, "text/plain", "OK", keep_alive=keep)
+        return keep
     if method == "POST" and path == "/retry":
-        await send_response(writer, 200, "text/html", AP_PAGE.replace("__SSID__", ap_page_ssid))
+        await send_response(
+            writer, 200, "text/html", AP_PAGE.replace("__SSID__", ap_page_ssid), keep_alive=keep
+        )
         stored = load_wifi_config()
         if stored:
             start_sta_task(stored)
-        return
+        return keep
     if method == "POST" and path == "/clear":
         try:
             with open(WIFI_CONFIG_FILE, "r"):
@@ -955,11 +2462,11 @@ async def handle_http(reader, writer, uart):
         )
         await asyncio.sleep(0.2)
         machine.reset()
-        return
+        return False
 
     if method != "GET":
-        await send_response(writer, 405, "text/plain", "Method Not Allowed")
-        return
+        await send_response(writer, 405, "text/plain", "Method Not Allowed", keep_alive=keep)
+        return keep
 
     if path == "/status":
         text = "IDLE"
@@ -969,61 +2476,108 @@ async def handle_http(reader, writer, uart):
             text = "CONNECTED " + sta_ip
         elif sta_status == "failed":
             text = "FAILED"
-        await send_response(writer, 200, "text/plain", text)
-        return
-
-    if path == "/api/state":
-        await send_response(writer, 200, "text/plain", last_state_line or "")
-        return
-    if path == "/api/labels":
-        await send_response(writer, 200, "text/plain", last_labels_line or "")
-        return
-    if path == "/api/amp_states":
-        await send_response(writer, 200, "text/plain", last_amp_states_line or "")
-        return
-    if path == "/api/tubes":
-        await send_response(writer, 200, "text/plain", render_tubes_lines())
-        return
+        await send_response(writer, 200, "text/plain", text, keep_alive=keep)
+        return keep
+
+    if path in API_PAYLOAD_KINDS:
+        if path == "/api/snapshot":
+            etag = snapshot_etag()
+            if etag_matches(headers.get("if-none-match", ""), etag):
+                await send_not_modified(writer, "ETag: %s\r\n" % etag, keep)
+                return keep
+        await send_payload(writer, api_payload(path, keep), keep)
+        return keep
+    if path == "/api/wait":
+        if wait_parked >= HTTP_WAIT_MAX_PARKED:
+            http_stats["wait_rejected"] += 1
+            await send_response(
+                writer, 503, "text/plain", "BUSY", "Retry-After: 2\r\n", keep_alive=keep
+            )
+            return keep
+        http_stats["waits"] += 1
+        body = await wait_for_changes(parse_query(query), reader)
+        if body is None:
+            # Released the slot as soon as the client left; nothing to answer.
+            http_stats["wait_abandoned"] += 1
+            return False
+        await send_response(writer, 200, "text/plain", body, keep_alive=keep)
+        return keep
+    if path == "/api/stream":
+        if len(streams) >= SSE_MAX_STREAMS:
+            sse_stats["rejected"] += 1
+            await send_response(
+                writer, 503, "text/plain", "BUSY", "Retry-After: 5\r\n", keep_alive=keep
+            )
+            return keep
+        await sse_session(writer, query, headers.get("last-event-id", ""))
+        return False
+    if path == "/api/stats":
+        await send_response(
+            writer, 200, "application/json", json.dumps(collect_stats()), keep_alive=keep
+        )
+        return keep
 
     if path == "/" or path == "/index.html":
         if is_setup_mode_active():
             log("Serving setup page in AP mode")
-            await send_response(writer, 200, "text/html", AP_PAGE.replace("__SSID__", ap_page_ssid))
+            await send_response(
+                writer, 200, "text/html", AP_PAGE.replace("__SSID__", ap_page_ssid), keep_alive=keep
+            )
         else:
-            await send_file(writer, "web/index.html", "text/html")
-        return
+            return await send_file(writer, "web/index.html", "text/html", keep, headers)
+        return keep
+    versioned = "v" in parse_query(query)
     if path == "/app.js":
-        await send_file(writer, "web/app.js", "application/javascript")
-        return
+        return await send_file(
+            writer, "web/app.js", "application/javascript", keep, headers, versioned
+        )
     if path == "/style.css":
-        await send_file(writer, "web/style.css", "text/css")
-        return
+        return await send_file(writer, "web/style.css", "text/css", keep, headers, versioned)
+
+    await send_response(writer, 404, "text/plain", "Not Found", keep_alive=keep)
+    return keep
 
-    await send_response(writer, 404, "text/plain", "Not Found")
 
+def version_header(kind):
+    return "X-Version: %d\r\n" % state_versions[kind]
 
-async def send_response(writer, status_code, content_type, body):
+
+def response_head(status_code, content_type, length, extra_headers, keep_alive):
     status_text = {
         200: "OK",
         400: "Bad Request",
         403: "Forbidden",
         404: "Not Found",
         405: "Method Not Allowed",
+        503: "Service Unavailable",
     }.get(status_code, "OK")
-
-    if isinstance(body, bytes):
-        data = body
-    else:
-        data = body.encode("utf-8")
-    header = (
+    return (
         "HTTP/1.1 %d %s\r\n"
         "Content-Type: %s\r\n"
         "Content-Length: %d\r\n"
         "Cache-Control: no-store, no-cache, must-revalidate, max-age=0\r\n"
         "Pragma: no-cache\r\n"
         "Expires: 0\r\n"
-        "Connection: close\r\n\r\n"
-    ) % (status_code, status_text, content_type, len(data))
+        "%s"
+        "%s\r\n"
+    ) % (
+        status_code,
+        status_text,
+        content_type,
+        length,
+        extra_headers,
+        connection_header(keep_alive),
+    )
+
+
+async def send_response(
+    writer, status_code, content_type, body, extra_headers="", keep_alive=False
+):
+    if isinstance(body, bytes):
+        data = body
+    else:
+        data = body.encode("utf-8")
+    header = response_head(status_code, content_type, len(data), extra_headers, keep_alive)
 
     try:
         writer.write(header.encode("utf-8"))
@@ -1039,43 +2593,235 @@ async def send_response(writer, status_code, content_type, body):
         if not is_benign_socket_close(exc):
             raise
     finally:
-        await close_writer(writer)
+        if not keep_alive:
+            await close_writer(writer)
 
 
-async def send_file(writer, path, content_type):
-    size = None
+async def send_payload(writer, data, keep_alive):
+    # A prebuilt response, headers included, in a single write.
     try:
-        size = os.stat(path)[6]
-    except OSError:
-        await send_response(writer, 404, "text/plain", "Not Found")
-        return
+        writer.write(data)
+        await writer.drain()
+    except OSError as exc:
+        if not is_benign_socket_close(exc):
+            raise
+    finally:
+        if not keep_alive:
+            await close_writer(writer)
 
+
+def connection_header(keep_alive):
+    if keep_alive:
+        return "Connection: keep-alive\r\nKeep-Alive: timeout=%d, max=%d\r\n" % (
+            HTTP_KEEPALIVE_IDLE_MS // 1000,
+            HTTP_KEEPALIVE_MAX_REQUESTS,
+        )
+    return "Connection: close\r\n"
+
+
+async def send_file(
+    writer, path, content_type, keep_alive=False, headers=None, versioned=False
+):
+    # Returns False if the connection was closed and must not be reused.
+    headers = headers or {}
+    stat = None
+    encoding = ""
+    # Prefer the gzip sibling built by sync_pico.sh when the client accepts it.
+    if "gzip" in headers.get("accept-encoding", ""):
+        stat = file_stat(path + ".gz")
+        if stat:
+            path += ".gz"
+            encoding = "Content-Encoding: gzip\r\n"
+    if stat is None:
+        stat = file_stat(path)
+    if stat is None:
+        await send_response(writer, 404, "text/plain", "Not Found", keep_alive=keep_alive)
+        return keep_alive
+
+    sent = 0
     try:
+        etag = asset_etag(path, stat)
+        # ?v= URLs change whenever the asset does, so they never need revalidating.
+        cache = "public, max-age=31536000, immutable" if versioned else "no-cache"
+        common = (
+            "ETag: %s\r\n"
+            "Cache-Control: %s\r\n"
+            "Vary: Accept-Encoding\r\n"
+        ) % (etag, cache)
+        if etag_matches(headers.get("if-none-match", ""), etag):
+            await send_not_modified(writer, common, keep_alive)
+            return keep_alive
+        # Load before the headers go out so a failed load can still stream.
+        data = asset_cache_get(path, stat)
         header = (
             "HTTP/1.1 200 OK\r\n"
             "Content-Type: %s\r\n"
             "Content-Length: %d\r\n"
-            "Cache-Control: no-store, no-cache, must-revalidate, max-age=0\r\n"
-            "Pragma: no-cache\r\n"
-            "Expires: 0\r\n"
-            "Connection: close\r\n\r\n"
-        ) % (content_type, size)
+            "%s"
+            "%s"
+            "%s\r\n"
+        ) % (content_type, stat[6], encoding, common, connection_header(keep_alive))
         writer.write(header.encode("utf-8"))
         await writer.drain()
-        with open(path, "rb") as f:
-            while True:
-                chunk = f.read(1024)
-                if not chunk:
-                    break
+        if data is not None:
+            total = len(data)
+            while sent < total:
+                chunk = data[sent : sent + ASSET_SEND_CHUNK]
                 writer.write(chunk)
                 await writer.drain()
+                sent += len(chunk)
+        else:
+            with open(path, "rb") as f:
+                while True:
+                    chunk = f.read(1024)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+                    await writer.drain()
+                    sent += len(chunk)
     except OSError as exc:
         if not is_benign_socket_close(exc):
             log("send_file socket error for", path, ":", exc)
     except Exception as exc:
         log("send_file error for", path, ":", exc)
-    finally:
+    if sent != stat[6]:
+        # Short body: the client cannot find the next response, so hang up.
+        if keep_alive:
+            log("send_file short body for", path, ":", sent, "of", stat[6])
+        await close_writer(writer)
+        return False
+    if not keep_alive:
         await close_writer(writer)
+    return keep_alive
+
+
+async def send_not_modified(writer, extra_headers, keep_alive):
+    header = "HTTP/1.1 304 Not Modified\r\n%s%s\r\n" % (
+        extra_headers,
+        connection_header(keep_alive),
+    )
+    try:
+        writer.write(header.encode("utf-8"))
+        await writer.drain()
+    except OSError as exc:
+        if not is_benign_socket_close(exc):
+            raise
+
+
+def file_stat(path):
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def asset_etag(path, stat):
+    # Strong ETag from a content hash, recomputed only if size or mtime change.
+    cached = asset_etags.get(path)
+    if cached and cached[0] == stat[6] and cached[1] == stat[8]:
+        return cached[2]
+    digest = uhashlib.sha1()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(1024)
+            if not chunk:
+                break
+            digest.update(chunk)
+    etag = '"%s"' % ubinascii.hexlify(digest.digest()[:8]).decode()
+    asset_etags[path] = (stat[6], stat[8], etag)
+    return etag
+
+
+def asset_cache_get(path, stat):
+    # Cached bytes for path, loading them on a miss when budget and heap allow.
+    # Only gzip copies are kept; the rarer identity requests stream from flash.
+    global asset_cache_bytes, asset_cache_clock
+    if not ASSET_CACHE_BYTES or not path.endswith(".gz"):
+        return None
+    asset_cache_trim()
+    asset_cache_clock += 1
+    entry = asset_cache.get(path)
+    if entry and entry[0] == stat[6] and entry[1] == stat[8]:
+        entry[3] = asset_cache_clock
+        asset_cache_stats["hits"] += 1
+        return entry[2]
+    asset_cache_stats["misses"] += 1
+    if entry:
+        asset_cache_drop(path)
+    size = stat[6]
+    if size > ASSET_CACHE_BYTES:
+        return None
+    while asset_cache_bytes + size > ASSET_CACHE_BYTES:
+        oldest = None
+        for key in asset_cache:
+            if oldest is None or asset_cache[key][3] < asset_cache[oldest][3]:
+                oldest = key
+        asset_cache_drop(oldest)
+        asset_cache_stats["evictions"] += 1
+    if gc.mem_free() - size < ASSET_CACHE_LOW_WATER:
+        gc.collect()
+        if gc.mem_free() - size < ASSET_CACHE_LOW_WATER:
+            return None
+    try:
+        with open(path, "rb") as f:
+            data = memoryview(f.read())
+    except MemoryError:
+        # Fragmented heap: the caller streams the file from flash instead.
+        asset_cache_stats["mem_errors"] += 1
+        gc.collect()
+        return None
+    except OSError as exc:
+        log("asset cache load failed for", path, ":", exc)
+        return None
+    if len(data) != size:
+        return None
+    asset_cache[path] = [size, stat[8], data, asset_cache_clock]
+    asset_cache_bytes += size
+    return data
+
+
+def asset_cache_drop(path):
+    global asset_cache_bytes
+    entry = asset_cache.pop(path, None)
+    if entry:
+        asset_cache_bytes -= entry[0]
+
+
+def asset_cache_trim():
+    # Give the heap back to the rest of the bridge when it runs low.
+    if asset_cache and gc.mem_free() < ASSET_CACHE_LOW_WATER:
+        for path in list(asset_cache):
+            asset_cache_drop(path)
+            asset_cache_stats["low_mem_drops"] += 1
+        gc.collect()
+
+
+def asset_cache_snapshot():
+    stats = dict(asset_cache_stats)
+    stats["files"] = len(asset_cache)
+    stats["bytes"] = asset_cache_bytes
+    stats["budget"] = ASSET_CACHE_BYTES
+    return stats
+
+
+def etag_matches(header, etag):
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag == etag or tag == "W/" + etag:
+            return True
+    return False
+
+
+def warm_asset_etags():
+    # Hash the static files at boot so the first page load doesn't pay for it.
+    for path in STATIC_FILES:
+        for variant in (path, path + ".gz"):
+            stat = file_stat(variant)
+            if stat:
+                try:
+                    asset_etag(variant, stat)
+                except OSError as exc:
+                    log("ETag error for", variant, ":", exc)
 
 
 async def close_writer(writer):
@@ -1090,12 +2836,18 @@ async def close_writer(writer):
 
 
 def parse_form(body):
-    result = {}
     if not body:
-        return result
+        return {}
     try:
         text = body.decode("utf-8")
     except Exception:
+        return {}
+    return parse_query(text)
+
+
+def parse_query(text):
+    result = {}
+    if not text:
         return result
     for part in text.split("&"):
         if "=" in part:
@@ -1104,24 +2856,6 @@ def parse_form(body):
     return result
 
 
-def url_decode(value):
-    value = value.replace("+", " ")
-    out = ""
-    i = 0
-    while i < len(value):
-        ch = value[i]
-        if ch == "%" and i + 2 < len(value):
-            try:
-                out += chr(int(value[i + 1 : i + 3], 16))
-                i += 3
-                continue
-            except Exception:
-                pass
-        out += ch
-        i += 1
-    return out
-
-
 def start_sta_task(creds):
     global sta_task, sta_status, sta_ip
     sta_status = "connecting"
@@ -1131,35 +2865,6 @@ def start_sta_task(creds):
     sta_task = asyncio.create_task(sta_connect_task(creds))
 
 
-def decode_dns_name(data, offset):
-    labels = []
-    jumped = False
-    jump_offset = 0
-    while True:
-        if offset >= len(data):
-            return "", offset
-        length = data[offset]
-        if length == 0:
-            offset += 1
-            break
-        if length & 0xC0:
-            if offset + 1 >= len(data):
-                return "", offset + 1
-            pointer = ((length & 0x3F) << 8) | data[offset + 1]
-            if not jumped:
-                jump_offset = offset + 2
-                jumped = True
-            offset = pointer
-            continue
-        offset += 1
-        if offset + length > len(data):
-            return "", offset + length
-        labels.append(data[offset : offset + length].decode("utf-8"))
-        offset += length
-    name = ".".join(labels)
-    return name, (jump_offset if jumped else offset)
-
-
 def build_dns_captive_response(data, ip):
     if len(data) < 12:
         return None
@@ -1282,7 +2987,9 @@ async def main():
     asyncio.create_task(uart_writer_task(uart))
     asyncio.create_task(uart_reader_task(uart))
     asyncio.create_task(uart_startup_sync(uart))
+    asyncio.create_task(ws_keepalive_task())
 
+    warm_asset_etags()
     gc.collect()
     server = await asyncio.start_server(
         lambda r, w: handle_http(r, w, uart), HTTP_HOST, HTTP_PORT
@@ -1299,8 +3006,9 @@ async def main():
         await asyncio.sleep(5)
 
 
-try:
-    asyncio.run(main())
-finally:
-    reset_wifi_radios()
-    asyncio.new_event_loop()
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    finally:
+        reset_wifi_radios()
+        asyncio.new_event_loop()
@@ -7,6 +7,11 @@ PICO_DIR="$ROOT_DIR/pico"
 rm -rf "$PICO_DIR"
 mkdir -p "$PICO_DIR/web"
 
-cp -f "$ROOT_DIR/main.py" "$ROOT_DIR/config.py" "$PICO_DIR/"
+cp -f "$ROOT_DIR/main.py" "$ROOT_DIR/config.py" "$ROOT_DIR/hotpath.py" "$PICO_DIR/"
 
 cp -a "$ROOT_DIR/web/." "$PICO_DIR/web/"
+
+# Precompressed copies; main.py serves these to clients that accept gzip.
+for f in "$PICO_DIR"/web/*.html "$PICO_DIR"/web/*.js "$PICO_DIR"/web/*.css; do
+  gzip -9 -n -c "$f" > "$f.gz"
+done
@@ -46,7 +46,7 @@ def rm(path):
         except OSError:
             pass
 
-for p in ("main.py", "config.py", "web"):
+for p in ("main.py", "config.py", "hotpath.py", "web"):
     rm(p)
 PY
 )
@@ -62,14 +62,22 @@ MPREMOTE_ARGS=(
   +
   fs cp "$PICO_DIR/config.py" :
   +
+  fs cp "$PICO_DIR/hotpath.py" :
+  +
   fs mkdir web
   +
   fs cp "$PICO_DIR/web/index.html" :web/index.html
   +
+  fs cp "$PICO_DIR/web/index.html.gz" :web/index.html.gz
+  +
   fs cp "$PICO_DIR/web/app.js" :web/app.js
   +
+  fs cp "$PICO_DIR/web/app.js.gz" :web/app.js.gz
+  +
   fs cp "$PICO_DIR/web/style.css" :web/style.css
   +
+  fs cp "$PICO_DIR/web/style.css.gz" :web/style.css.gz
+  +
   reset
 )
 
@@ -31,7 +31,6 @@ let ampStates = {};
 let tubes = {};
 let currentAmp = null;
 let currentMute = null;
-let pollTimer = null;
 const MAX_QUEUED_LINES = 48;
 let queuedLines = [];
 let syncCooldownUntilMs = 0;
@@ -45,6 +44,11 @@ const HTTP_FALLBACK_STATE_POLL_DELAY_MS = 60;
 const HTTP_FALLBACK_RETRY_BACKOFF_MS = 60;
 const WS_RECONNECT_DELAY_MS = 700;
 const WS_FALLBACK_GRACE_MS = 2200;
+// Lets the bridge join bursts of lines into one newline-delimited frame.
+const WS_BATCH_PROTOCOL = "batch.lines";
+// Resume point from the bridge's "SEQ <n> <boot>" lines; sent on reconnect.
+let lastEventSeq = 0;
+let bridgeBootId = "";
 let lastReconnectKickMs = 0;
 const RECONNECT_KICK_MIN_INTERVAL_MS = 2000;
 let startupPollTimer = null;
@@ -70,9 +74,12 @@ let tubeSnapshot = {};
 let pendingManualTubeRefresh = false;
 let pendingManualTubeRefreshTimer = null;
 const HTTP_FALLBACK_POLL_INTERVAL_MS = 1200;
-const HTTP_FALLBACK_META_POLL_EVERY = 12;
 let pollInFlight = false;
-let fallbackMetaPollCountdown = 0;
+// ETag of the last /api/snapshot applied; the bridge answers 304 while it matches.
+let snapshotEtag = "";
+let snapshotSections = {};
+// Set while the /api/wait long-poll loop runs; aborting it ends the loop.
+let longPollAbort = null;
 let suspendCloseInProgress = false;
 let pendingStatePollTimer = null;
 let fallbackStartTimer = null;
@@ -82,9 +89,9 @@ function isPageVisible() {
 }
 
 function clearPollTimer() {
-  if (pollTimer) {
-    clearInterval(pollTimer);
-    pollTimer = null;
+  if (longPollAbort) {
+    longPollAbort.abort();
+    longPollAbort = null;
   }
 }
 
@@ -124,8 +131,9 @@ function scheduleFallbackStart() {
     if (!isPageVisible()) {
       return;
     }
-    if (!pollTimer) {
-      pollTimer = setInterval(pollState, HTTP_FALLBACK_POLL_INTERVAL_MS);
+    if (!longPollAbort) {
+      longPollAbort = new AbortController();
+      longPoll(longPollAbort);
     }
   }, WS_FALLBACK_GRACE_MS);
 }
@@ -421,36 +429,15 @@ async function pollState() {
   }
   pollInFlight = true;
   try {
-    const fetchMeta = fallbackMetaPollCountdown <= 0;
-    if (fetchMeta) {
-      fallbackMetaPollCountdown = HTTP_FALLBACK_META_POLL_EVERY;
-    } else {
-      fallbackMetaPollCountdown -= 1;
-    }
-
-    const stateRes = await fetch("/api/state");
-    const stateLine = (await stateRes.text()).trim();
-    if (stateLine.startsWith("STATE ")) {
-      handleStateLine(stateLine);
+    const headers = {};
+    if (snapshotEtag) {
+      headers["If-None-Match"] = snapshotEtag;
     }
-    if (fetchMeta) {
-      const [labelsRes, ampStatesRes, tubesRes] = await Promise.all([
-        fetch("/api/labels"),
-        fetch("/api/amp_states"),
-        fetch("/api/tubes"),
-      ]);
-      const labelsLine = (await labelsRes.text()).trim();
-      const ampStatesLine = (await ampStatesRes.text()).trim();
-      const tubesText = (await tubesRes.text()).trim();
-      if (labelsLine.startsWith("SELECTOR_LABELS")) {
-        handleLabelsLine(labelsLine);
-      }
-      if (ampStatesLine.startsWith("AMP_STATES")) {
-        handleAmpStatesLine(ampStatesLine);
-      }
-      if (tubesText) {
-        handleTubesText(tubesText);
-      }
+    const res = await fetch("/api/snapshot", { cache: "no-store", headers });
+    if (res.status === 200) {
+      const text = await res.text();
+      snapshotEtag = res.headers.get("ETag") || "";
+      applySnapshot(text);
     }
   } catch (err) {
     // best-effort polling fallback
@@ -459,6 +446,71 @@ async function pollState() {
   }
 }
 
+function applySnapshot(text) {
+  const sections = { state: "", labels: "", ampStates: "", tubes: [] };
+  text.split(/\r?\n/).forEach((raw) => {
+    const line = raw.trim();
+    if (line.startsWith("STATE ")) {
+      sections.state = line;
+    } else if (line.startsWith("SELECTOR_LABELS")) {
+      sections.labels = line;
+    } else if (line.startsWith("AMP_STATES")) {
+      sections.ampStates = line;
+    } else if (line.startsWith("TUBE ") || line === "END TUBES") {
+      sections.tubes.push(line);
+    }
+  });
+  sections.tubes = sections.tubes.join("\n");
+  // State is always applied; the rest only re-render when they changed.
+  if (sections.state) {
+    handleStateLine(sections.state);
+  }
+  if (sections.labels && sections.labels !== snapshotSections.labels) {
+    handleLabelsLine(sections.labels);
+  }
+  if (sections.ampStates && sections.ampStates !== snapshotSections.ampStates) {
+    handleAmpStatesLine(sections.ampStates);
+  }
+  if (sections.tubes && sections.tubes !== snapshotSections.tubes) {
+    handleTubesText(sections.tubes);
+  }
+  snapshotSections = sections;
+}
+
+async function longPoll(controller) {
+  // The bridge holds each /api/wait until a new line arrives, so changes show
+  // up immediately without a fixed poll interval.
+  while (!controller.signal.aborted) {
+    if (ws && ws.readyState === WebSocket.OPEN) {
+      return;
+    }
+    const boot = encodeURIComponent(bridgeBootId);
+    try {
+      const res = await fetch(`/api/wait?since=${lastEventSeq}&boot=${boot}`, {
+        cache: "no-store",
+        signal: controller.signal,
+      });
+      if (res.status === 200) {
+        const text = await res.text();
+        text.split("\n").forEach((line) => {
+          const one = line.trim();
+          if (one) {
+            handleServerLine(one);
+          }
+        });
+        continue;
+      }
+      // Too many parked requests on the bridge; take a plain snapshot instead.
+      pollState();
+    } catch (err) {
+      if (controller.signal.aborted) {
+        return;
+      }
+    }
+    await new Promise((resolve) => setTimeout(resolve, HTTP_FALLBACK_POLL_INTERVAL_MS));
+  }
+}
+
 function setActiveInput(value) {
   const buttons = inputGroupEl.querySelectorAll("button[data-input]");
   buttons.forEach((btn) => {
@@ -836,12 +888,104 @@ function updateAmpStateView() {
   ampStateValueEl.textContent = label || String(currentAmp);
 }
 
+function handleServerLine(line) {
+  if (line.startsWith("SEQ ")) {
+    const parts = line.split(/\s+/);
+    const seq = Number(parts[1]);
+    if (!Number.isNaN(seq)) {
+      lastEventSeq = seq;
+      bridgeBootId = parts[2] || "";
+    }
+    return;
+  }
+  if (line.startsWith("STATE ")) {
+    handleStateLine(line);
+  } else if (line.startsWith("SELECTOR_LABELS")) {
+    handleLabelsLine(line);
+  } else if (line.startsWith("AMP_STATES")) {
+    handleAmpStatesLine(line);
+  } else if (line.startsWith("TUBE ")) {
+    handleTubeLine(line);
+  } else if (line === "TUBES_END" || line === "END TUBES") {
+    if (pendingTubeSnapshot) {
+      pendingTubeSnapshot = false;
+      applyTubesMap(tubeSnapshot);
+      tubeSnapshot = {};
+    } else {
+      renderTubes();
+      completeManualTubeRefreshStatus();
+    }
+  } else if (
+    line.startsWith("ACK MUTE START")
+    || line.startsWith("ACK MUTE DONE")
+    || line.startsWith("ACK STBY START")
+    || line.startsWith("ACK STBY DONE")
+  ) {
+    debugWs(line);
+    if (line.startsWith("ACK MUTE START")) {
+      // consumed for reliability/debug; no UI annunciator needed
+    } else if (line.startsWith("ACK MUTE DONE")) {
+      // consumed for reliability/debug; no UI annunciator needed
+    } else if (line.startsWith("ACK STBY START")) {
+      // consumed for reliability/debug; no UI annunciator needed
+    } else if (line.startsWith("ACK STBY DONE")) {
+      // consumed for reliability/debug; no UI annunciator needed
+    }
+  } else if (
+    line.startsWith("ACK TUBE")
+    || line.startsWith("ACK ADD")
+    || line.startsWith("ACK DEL")
+  ) {
+    setTubeEditorStatus(line);
+    if (line.startsWith("ACK DEL")) {
+      clearPendingTubeDelete();
+      setTimeout(requestTubesSnapshot, 150);
+    }
+  } else if (line.startsWith("DONE SAVE")) {
+    const num = parseIntField(line, "NUM");
+    if (num !== null) {
+      setTubeEditorStatus(`Tube ${num} save completed.`);
+      if (selectedTubeNum === num) {
+        clearTubeEditorDirty();
+      }
+      if (pendingTubeSave && pendingTubeSave.num === num) {
+        pendingTubeSave.ignoreUntilMs = Date.now() + 1200;
+      }
+    } else {
+      setTubeEditorStatus("Tube save completed.");
+      clearTubeEditorDirty();
+    }
+    setTimeout(requestTubesSnapshot, 250);
+  } else if (line.startsWith("ERR")) {
+    pendingManualTubeRefresh = false;
+    if (pendingManualTubeRefreshTimer) {
+      clearTimeout(pendingManualTubeRefreshTimer);
+      pendingManualTubeRefreshTimer = null;
+    }
+    pendingTubeSave = null;
+    clearPendingTubeDelete();
+    pendingStandbyTarget = null;
+    pendingStandbyRetriesLeft = 0;
+    standbyInFlight = false;
+    if (standbyInFlightTimer) {
+      clearTimeout(standbyInFlightTimer);
+      standbyInFlightTimer = null;
+    }
+    if (pendingStandbyRetryTimer) {
+      clearTimeout(pendingStandbyRetryTimer);
+      pendingStandbyRetryTimer = null;
+    }
+    setTubeEditorStatus(line);
+  }
+}
+
 function connectWebSocket() {
   if (ws && (ws.readyState === WebSocket.OPEN || ws.readyState === WebSocket.CONNECTING)) {
     return;
   }
-  const wsUrl = `ws://${window.location.host}/ws`;
-  const socket = new WebSocket(wsUrl);
+  const resume = `since=${lastEventSeq}&boot=${encodeURIComponent(bridgeBootId)}`;
+  const wsUrl = `ws://${window.location.host}/ws?${resume}`;
+  const socket = new WebSocket(wsUrl, [WS_BATCH_PROTOCOL]);
   ws = socket;
 
   socket.addEventListener("open", () => {
@@ -851,7 +995,7 @@ function connectWebSocket() {
     debugWs("ws open");
     setStatus("Connected", true);
     wsLastMessageMs = Date.now();
-    fallbackMetaPollCountdown = 0;
+    snapshotEtag = "";
     suspendCloseInProgress = false;
     clearFallbackStartTimer();
     startWsHealthTimer();
@@ -871,88 +1015,15 @@ function connectWebSocket() {
     if (ws !== socket) {
       return;
     }
-    const line = String(event.data || "").trim();
-    if (!line) return;
+    const text = String(event.data || "");
+    if (!text.trim()) return;
     wsLastMessageMs = Date.now();
-    if (line.startsWith("STATE ")) {
-      handleStateLine(line);
-    } else if (line.startsWith("SELECTOR_LABELS")) {
-      handleLabelsLine(line);
-    } else if (line.startsWith("AMP_STATES")) {
-      handleAmpStatesLine(line);
-    } else if (line.startsWith("TUBE ")) {
-      handleTubeLine(line);
-    } else if (line === "TUBES_END" || line === "END TUBES") {
-      if (pendingTubeSnapshot) {
-        pendingTubeSnapshot = false;
-        applyTubesMap(tubeSnapshot);
-        tubeSnapshot = {};
-      } else {
-        renderTubes();
-        completeManualTubeRefreshStatus();
-      }
-    } else if (
-      line.startsWith("ACK MUTE START")
-      || line.startsWith("ACK MUTE DONE")
-      || line.startsWith("ACK STBY START")
-      || line.startsWith("ACK STBY DONE")
-    ) {
-      debugWs(line);
-      if (line.startsWith("ACK MUTE START")) {
-        // consumed for reliability/debug; no UI annunciator needed
-      } else if (line.startsWith("ACK MUTE DONE")) {
-        // consumed for reliability/debug; no UI annunciator needed
-      } else if (line.startsWith("ACK STBY START")) {
-        // consumed for reliability/debug; no UI annunciator needed
-      } else if (line.startsWith("ACK STBY DONE")) {
-        // consumed for reliability/debug; no UI annunciator needed
-      }
-    } else if (
-      line.startsWith("ACK TUBE")
-      || line.startsWith("ACK ADD")
-      || line.startsWith("ACK DEL")
-    ) {
-      setTubeEditorStatus(line);
-      if (line.startsWith("ACK DEL")) {
-        clearPendingTubeDelete();
-        setTimeout(requestTubesSnapshot, 150);
-      }
-    } else if (line.startsWith("DONE SAVE")) {
-      const num = parseIntField(line, "NUM");
-      if (num !== null) {
-        setTubeEditorStatus(`Tube ${num} save completed.`);
-        if (selectedTubeNum === num) {
-          clearTubeEditorDirty();
-        }
-        if (pendingTubeSave && pendingTubeSave.num === num) {
-          pendingTubeSave.ignoreUntilMs = Date.now() + 1200;
-        }
-      } else {
-        setTubeEditorStatus("Tube save completed.");
-        clearTubeEditorDirty();
-      }
-      setTimeout(requestTubesSnapshot, 250);
-    } else if (line.startsWith("ERR")) {
-      pendingManualTubeRefresh = false;
-      if (pendingManualTubeRefreshTimer) {
-        clearTimeout(pendingManualTubeRefreshTimer);
-        pendingManualTubeRefreshTimer = null;
+    text.split("\n").forEach((one) => {
+      const line = one.trim();
+      if (line) {
+        handleServerLine(line);
       }
-      pendingTubeSave = null;
-      clearPendingTubeDelete();
-      pendingStandbyTarget = null;
-      pendingStandbyRetriesLeft = 0;
-      standbyInFlight = false;
-      if (standbyInFlightTimer) {
-        clearTimeout(standbyInFlightTimer);
-        standbyInFlightTimer = null;
-      }
-      if (pendingStandbyRetryTimer) {
-        clearTimeout(pendingStandbyRetryTimer);
-        pendingStandbyRetryTimer = null;
-      }
-      setTubeEditorStatus(line);
-    }
+    });
   });
 
   socket.addEventListener("close", (event) => {